@@ -0,0 +1,146 @@
+"""Headless throughput benchmark of the aigar envs.
+
+Measures the steps per second, the reset latency, the time of every phase of Field.update (per step and per field
+update, which differ for envs with frame skipping) and the time of the observation computation for the registered env
+ids, and writes the results as json:
+
+    python -m aigar.benchmark --envs "AigarGreedy*Grid*" --steps 500 --output results.json
+"""
+import argparse
+import fnmatch
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from aigar.registration import getEnvSpecs
+
+
+def getNumbaVersion():
+    try:
+        import numba
+    except ImportError:
+        return None
+    return numba.__version__
+
+
+def summarize(durations):
+    durations = np.asarray(durations) * 1000
+    return {"mean_ms": float(durations.mean()), "median_ms": float(np.median(durations)),
+            "min_ms": float(durations.min()), "max_ms": float(durations.max())}
+
+
+def benchmarkEnv(envKwargs, steps, resets, observations, seed):
+    from aigar.envs import AigarEnv
+    env = AigarEnv(seed=seed, collect_stats=True, **envKwargs)
+    rng = np.random.default_rng(seed)
+    env.reset()
+
+    resetTimes = []
+    for _ in range(resets):
+        start = time.perf_counter()
+        env.reset()
+        resetTimes.append(time.perf_counter() - start)
+
+    env.reset_stats()
+    actions = rng.random((steps, env.num_actions))
+    stepTime = 0.0
+    episodes = 0
+    for action in actions:
+        start = time.perf_counter()
+        _, _, done, _ = env.step(action)
+        stepTime += time.perf_counter() - start
+        if done:
+            episodes += 1
+            env.reset()
+    stats = env.get_stats()
+    phaseTimes = stats["phaseTimesMs"]
+    updateTime = sum(phaseTimes.values())
+    # With frame skipping every step runs several field updates
+    updates = stats["updates"]
+
+    bot = env.gym_bot
+    observationTimes = []
+    for _ in range(observations):
+        start = time.perf_counter()
+        if env.rgb:
+            bot.rgbGenerator.get_cnn_inputRGB(bot.getPlayer())
+        else:
+            bot.getGridStateRepresentation()
+        observationTimes.append(time.perf_counter() - start)
+    observationName = "get_cnn_inputRGB" if env.rgb else "getGridStateRepresentation"
+
+    result = {"kwargs": envKwargs,
+              "steps": steps,
+              "episodes_finished": episodes,
+              "steps_per_sec": steps / stepTime if stepTime else None,
+              "step_ms": stepTime / steps * 1000 if steps else None,
+              "reset": summarize(resetTimes) if resets else None,
+              "field_updates": updates,
+              "field_update_ms_per_step": updateTime / steps if steps else None,
+              "field_update_ms_per_update": updateTime / updates if updates else None,
+              "phases": {phase: {"ms_per_step": phaseTime / steps if steps else None,
+                                 "ms_per_update": phaseTime / updates if updates else None,
+                                 "fraction": phaseTime / updateTime if updateTime else None}
+                         for phase, phaseTime in phaseTimes.items()},
+              "counters_per_step": {name: value / steps for name, value in stats["counters"].items()} if steps
+              else None,
+              "counters_per_update": stats["countersPerUpdate"],
+              "hash_tables": stats["hashTables"],
+              "observation": dict(summarize(observationTimes), name=observationName) if observations else None,
+              "cells": int(env.field.getCellStore().getCount())}
+    env.close()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures the throughput of the aigar envs.")
+    parser.add_argument("--envs", nargs="+", default=["*"],
+                        help="Patterns of the env ids to benchmark, e.g. 'AigarGreedy1*' (default: all)")
+    parser.add_argument("--steps", type=int, default=200, help="Steps per env")
+    parser.add_argument("--resets", type=int, default=20, help="Timed resets per env")
+    parser.add_argument("--observations", type=int, default=50, help="Timed observation computations per env")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hash-backend", default=None, help="Overrides the hash table backend of the envs")
+    parser.add_argument("--rgb-backend", default=None, help="Overrides the rgb backend of the envs")
+    parser.add_argument("--kernel-backend", default=None, help="Overrides the kernel backend of the envs")
+    parser.add_argument("--output", default=None, help="Path of the json file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    envs = getEnvSpecs()
+    envIds = [envId for envId in sorted(envs) if any(fnmatch.fnmatchcase(envId, pattern) for pattern in args.envs)]
+    if not envIds:
+        parser.error("No registered env matches " + str(args.envs))
+
+    results = {}
+    for envId in envIds:
+        envKwargs = envs[envId]
+        if args.hash_backend is not None:
+            envKwargs["hash_backend"] = args.hash_backend
+        if args.rgb_backend is not None and envKwargs.get("rgb"):
+            envKwargs["rgb_backend"] = args.rgb_backend
+        if args.kernel_backend is not None:
+            envKwargs["kernel_backend"] = args.kernel_backend
+        results[envId] = benchmarkEnv(envKwargs, args.steps, args.resets, args.observations, args.seed)
+        print(envId + ": " + str(round(results[envId]["steps_per_sec"] or 0, 1)) + " steps/sec", file=sys.stderr)
+
+    report = {"meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "python": platform.python_version(),
+                       "numpy": np.__version__,
+                       "numba": getNumbaVersion(),
+                       "platform": platform.platform(),
+                       "processor": platform.processor(),
+                       "args": vars(args)},
+              "results": results}
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
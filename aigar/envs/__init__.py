@@ -1,2 +1,17 @@
-from aigar.envs.aigarEnv import AigarEnv
+import importlib
 
+# The envs are imported on first use, such that importing one of them (or only the model) does not import the
+# modules of the others
+ENV_MODULES = {"AigarEnv": "aigar.envs.aigarEnv",
+               "AigarVectorEnv": "aigar.envs.aigarVectorEnv",
+               "AigarSubprocVectorEnv": "aigar.envs.aigarSubprocVectorEnv",
+               "AigarRecorder": "aigar.envs.aigarRecording",
+               "AigarReplayer": "aigar.envs.aigarRecording"}
+
+__all__ = list(ENV_MODULES)
+
+
+def __getattr__(name):
+    if name in ENV_MODULES:
+        return getattr(importlib.import_module(ENV_MODULES[name]), name)
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
@@ -5,11 +5,24 @@ import numpy as np
 import gym
 from gym import spaces
 
-from aigar.envs.model.bot import Bot
+from aigar.envs.aigarRecording import AigarRecorder, KEYFRAME_INTERVAL
+from aigar.envs.model.bot import Bot, makeGreedyMoves
 from aigar.envs.model.field import Field
 from aigar.envs.model.parameters import *
 from aigar.envs.model.player import Player
-from aigar.envs.model.rgbGenerator import RGBGenerator
+
+RGB_BACKENDS = ("pygame", "numpy")
+RESET_MODES = ("respawn", "snapshot")
+
+
+# pygame is only imported if it is used for drawing
+def createRGBGenerator(field, parameters, resolution, backend):
+    if backend == "numpy":
+        from aigar.envs.model.numpyRGBGenerator import NumpyRGBGenerator
+        return NumpyRGBGenerator(field, parameters, resolution)
+    from aigar.envs.model.rgbGenerator import RGBGenerator
+    return RGBGenerator(field, parameters, resolution)
+
 
 # The aigar class is the main wrapper for the game engine.
 # It contains the field and the players.
@@ -19,9 +32,32 @@ class AigarEnv(gym.Env):
     """Custom Environment that follows gym interface"""
     metadata = {'render.modes': ['human']}
 
-    def __init__(self, rgb=False, num_greedy=0, split=False, eject=False):
+    def __init__(self, rgb=False, num_greedy=0, split=False, eject=False, hash_backend=HASH_TABLE_BACKEND,
+                 rgb_resolution=RGB_RESOLUTION, rgb_backend=RGB_BACKEND, reuse_obs=False, seed=None,
+                 reset_mode=RESET_MODE, collect_stats=False, field_scale=FIELD_SCALE, kernel_backend=KERNEL_BACKEND,
+                 frame_skip=FRAME_SKIP):
         super(AigarEnv, self).__init__()
+        if rgb_resolution < 1:
+            raise ValueError("The rgb resolution has to be at least one pixel!")
+        if rgb_backend not in RGB_BACKENDS:
+            raise ValueError("Unknown rgb backend " + str(rgb_backend) + ", choose one of " + str(list(RGB_BACKENDS)))
+        if reset_mode not in RESET_MODES:
+            raise ValueError("Unknown reset mode " + str(reset_mode) + ", choose one of " + str(list(RESET_MODES)))
+        if int(frame_skip) != frame_skip or frame_skip < 1:
+            raise ValueError("The frame skip has to be a positive integer!")
         self.rgb = rgb
+        self.rgb_resolution = rgb_resolution
+        self.rgb_backend = rgb_backend
+        # If set, observations are returned in a buffer of the env (the drawn frame for rgb) that the next step
+        # overwrites, instead of in a new array
+        self.reuse_obs = reuse_obs
+        self.obsBuffer = None
+        self.hash_backend = hash_backend
+        self.reset_mode = reset_mode
+        self.field_scale = field_scale
+        self.kernel_backend = kernel_backend
+        # Field updates per step
+        self.frame_skip = int(frame_skip)
         self.enable_split = split
         self.enable_eject = eject
         if num_greedy == 0:
@@ -39,15 +75,20 @@ class AigarEnv(gym.Env):
         self.humans = []
         self.playerSpectator = None
         self.spectatedPlayer = None
-        self.field = Field(self.virusEnabled)
+        self.field = Field(self.virusEnabled, seed)
+        # If set, the field times its update phases and counts its work, see get_stats
+        self.field.enableStats(collect_stats)
         self.screenWidth = None
         self.screenHeight = None
         self.counter = 0
+        # Tick at which the rgb generator drew its current frame, such that render() does not draw twice
+        self.frameTick = None
         self.timings = []
         self.rewards = []
         self.dataFiles = {}
 
         self.viewer= None
+        self.recorder = None
         # Set up model:
         self.gym_bot = self.createBot("Gym")
         for _ in range(num_greedy):
@@ -59,20 +100,73 @@ class AigarEnv(gym.Env):
         self.observation_space = self.create_observation_space()
     
     # Start Interface for gym env:
-    def step(self, action):
+    # If out is given, the observation is written into it
+    def step(self, action, out=None):
         if len(action) != self.num_actions:
             raise TypeError("The number of dimensions of the action does not match the action space!")
-        self.update(action=action)
-        obs, reward, done = self.getStepData()
-        return obs, reward, done, {}
+        stats = self.field.getStats()
+        if stats is not None:
+            statsMark = stats.getMark()
+        reward = self.updateSkippingFrames(action)
+        obs = self.get_state(out)
+        done = not self.gym_bot.player.getIsAlive()
+        info = {}
+        # The stats of all field updates of the step, summed
+        if stats is not None:
+            info["field_stats"] = stats.getSince(statsMark)
+        return obs, reward, done, info
         
-    def reset(self):
-        self.field.reset()
-        self.resetBots()
-        self.counter = 0
-        state = self.get_state()
+    # Seeds the random generator that drives the field and the bots of this env. Takes an int, a
+    # numpy.random.SeedSequence or None (seeds from the OS). Takes effect with the next reset.
+    def seed(self, seed=None):
+        self.field.seed(seed)
+        return [seed]
+
+    def reset(self, seed=None, out=None):
+        if seed is not None:
+            self.seed(seed)
+        self.resetModel()
+        state = self.get_state(out)
         return state
         
+    # Returns the time spent in every phase of the field update and the counters of the field since the env was
+    # created or reset_stats was called. Requires collect_stats=True.
+    def get_stats(self):
+        if self.field.getStats() is None:
+            raise RuntimeError("The env does not collect stats, create it with collect_stats=True!")
+        return self.field.getStats().getSummary()
+
+    def reset_stats(self):
+        if self.field.getStats() is not None:
+            self.field.getStats().reset()
+
+    # Records every following reset and step into a binary file that AigarReplayer can play back. A keyframe with all
+    # cells is stored every keyframe_interval ticks, the other ticks only store the cells that changed.
+    def start_recording(self, path, keyframe_interval=KEYFRAME_INTERVAL):
+        self.stop_recording()
+        self.recorder = AigarRecorder(path, self.field, self.num_actions, keyframe_interval)
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def close(self):
+        self.stop_recording()
+        self.render(close=True)
+
+    # Returns the complete state of the simulation (field, bots and step counter). restore_state continues from it
+    # exactly like the env continued after clone_state was called, any number of times.
+    def clone_state(self):
+        return self.field.snapshot(), [bot.snapshot() for bot in self.bots], self.counter
+
+    def restore_state(self, state):
+        fieldSnapshot, botSnapshots, self.counter = state
+        self.field.restore(fieldSnapshot)
+        for bot, botSnapshot in zip(self.bots, botSnapshots):
+            bot.restore(botSnapshot)
+        self.frameTick = None
+
     def render(self, mode="human", close=False):
         if close:
             if self.viewer is not None:
@@ -85,36 +179,71 @@ class AigarEnv(gym.Env):
         #    return
         #state = self.game.get_state()
         #img = state.image_buffer
-        img = self.gym_bot.rgbGenerator.get_cnn_inputRGB(self.gym_bot.player)
-        
-        if img is None:
-            img = np.zeros(shape=self.observation_space.shape, dtype=np.uint8)
+        self.drawFrame()
+        rgbGenerator = self.getRGBGenerator()
         if mode == 'rgb_array':
-            return img
+            return rgbGenerator.getFrame()
         elif mode == 'human':
             from gym.envs.classic_control import rendering
             if self.viewer is None:
                 self.viewer = rendering.SimpleImageViewer()
-            self.viewer.imshow(img)
+            self.viewer.imshow(rgbGenerator.getFrameView())
+
+    # Draws the rgb image of the gym bot, unless it was already drawn in this tick
+    def drawFrame(self):
+        if self.frameTick != self.counter:
+            self.getRGBGenerator().draw_cnnInput(self.gym_bot.player)
+            self.frameTick = self.counter
 
-    def get_state(self):
+    def get_state(self, out=None):
         if self.rgb:
-            state = self.gym_bot.rgbGenerator.get_cnn_inputRGB(self.gym_bot.player)
-        else:
-            state = self.gym_bot.getGridStateRepresentation()
+            self.drawFrame()
+            rgbGenerator = self.getRGBGenerator()
+            if out is None and self.reuse_obs:
+                return rgbGenerator.getFrameView()
+            return rgbGenerator.getFrame(out)
+        state = self.gym_bot.getGridStateRepresentation()
+        if out is None and self.reuse_obs:
+            if self.obsBuffer is None:
+                self.obsBuffer = np.empty_like(state)
+            out = self.obsBuffer
+        if out is not None:
+            out[:] = state
+            state = out
         return state
         
-    def getStepData(self):
-        state = get_state()
+    def getStepData(self, out=None):
+        state = self.get_state(out)
         reward = self.gym_bot.getReward()
         alive = self.gym_bot.player.getIsAlive()
         done = not alive
         return state, reward, done
                 
-    def update(self, action=None):
+    # Repeats the action for frame_skip field updates (splits and ejections are only commanded in the first one) and
+    # returns the summed reward of the gym bot. Stops early after the update in which the gym bot died.
+    def updateSkippingFrames(self, action):
+        reward = 0
+        for tick in range(self.frame_skip):
+            reward += self.updateTick(action, tick)
+            if not self.gym_bot.player.getIsAlive():
+                break
+        return reward
+
+    # Runs the field update number tick of a step and returns the reward of the gym bot for it. If greedyMovesMade is
+    # set, the greedy bots already decided (e.g. together with the bots of the other fields of a vector env).
+    def updateTick(self, action, tick=0, greedyMovesMade=False):
+        self.gym_bot.currentlySkipping = tick > 0
+        self.update(action, greedyMovesMade)
+        self.gym_bot.currentlySkipping = False
+        reward = self.gym_bot.getReward()
+        if self.recorder is not None:
+            self.recorder.recordTick(action, reward)
+        return reward
+
+    def update(self, action=None, greedyMovesMade=False):
         self.counter += 1
         # Get the decisions of the bots. Update the field accordingly.
-        self.takeBotActions(action)
+        self.takeBotActions(action, greedyMovesMade)
         self.field.update()
         
     def create_action_space(self):
@@ -132,9 +261,9 @@ class AigarEnv(gym.Env):
                           np.array(action_high, dtype=np.float32), dtype=np.float32)
 
     def rgb_space(self):
-        img = self.gym_bot.rgbGenerator.get_cnn_inputRGB(self.gym_bot.player)
-        obs_low = np.zeros_like(img)
-        obs_high = np.ones_like(img) * 255
+        length = self.getRGBGenerator().length
+        obs_low = np.zeros((length, length, 3), dtype=np.uint8)
+        obs_high = np.ones_like(obs_low) * 255
         return spaces.Box(np.array(obs_low, dtype=np.uint8),
                           np.array(obs_high, dtype=np.uint8), dtype=np.uint8)
         
@@ -161,13 +290,32 @@ class AigarEnv(gym.Env):
     def modifySettings(self, reset_time):
         self.resetLimit = reset_time
 
+    # Every reset goes through here (also the automatic ones of the vector env), such that a recording gets its reset
+    # marker and keyframe at every episode boundary
+    def resetModel(self):
+        if self.reset_mode == "snapshot":
+            self.field.resetToInitialState()
+        else:
+            self.field.reset()
+        self.resetBots()
+        self.counter = 0
+        self.frameTick = None
+        if self.recorder is not None:
+            self.recorder.recordTick(reset=True)
+
     def initialize(self):
-        self.field.initialize()
+        self.field.initialize(self.hash_backend, self.field_scale, self.kernel_backend)
         self.resetBots()
 
-    def takeBotActions(self, action):
+    # The living greedy bots decide together in one batched pass, before the moves of all bots are made
+    def takeBotActions(self, action, greedyMovesMade=False):
+        if not greedyMovesMade:
+            makeGreedyMoves(self.getLivingGreedyBots())
         for bot in self.bots:
-            bot.makeMove(action)
+            bot.makeMove(action, greedyMoveMade=True)
+
+    def getLivingGreedyBots(self):
+        return [bot for bot in self.bots if bot.getType() == "Greedy" and bot.getPlayer().getIsAlive()]
 
     def resetBots(self):
         for bot in self.bots:
@@ -187,13 +335,23 @@ class AigarEnv(gym.Env):
         name = botType + str(len(self.bots))
         newPlayer = self.createPlayer(name)
         rgbGenerator = None
-        if botType == "Gym":
-            rgbGenerator = RGBGenerator(self.field, parameters)
+        # Grid envs only create the generator (and import pygame) once render() is called
+        if botType == "Gym" and self.rgb:
+            rgbGenerator = self.createRGBGenerator(parameters)
         bot = Bot(newPlayer, self.field, botType, learningAlg, parameters, rgbGenerator,
                   use_enemy_grid=self.use_enemy_grid)
         self.addBot(bot)
         return bot
 
+    # Returns the rgb generator of the gym bot, creating it on first use
+    def getRGBGenerator(self):
+        if self.gym_bot.rgbGenerator is None:
+            self.gym_bot.rgbGenerator = self.createRGBGenerator(None)
+        return self.gym_bot.rgbGenerator
+
+    def createRGBGenerator(self, parameters):
+        return createRGBGenerator(self.field, parameters, self.rgb_resolution, self.rgb_backend)
+
     def createHuman(self, name):
         newPlayer = self.createPlayer(name)
         self.addHuman(newPlayer)
@@ -0,0 +1,276 @@
+import json
+
+import numpy as np
+
+from aigar.envs.model.cell import Cell
+from aigar.envs.model.cellStore import PELLET, BLOB, VIRUS, PLAYER
+from aigar.envs.model.field import Field
+from aigar.envs.model.parameters import *
+from aigar.envs.model.player import Player
+
+# Episodes are recorded as a stream of cell events in one binary file:
+#   header: MAGIC, format version, length of the header json, header json (field size, players, ...)
+#   events: one EVENT_DTYPE record per event, the events of a tick are stored contiguously
+#   tick table: first event, keyframe and reset flags, action and reward of every tick
+#   footer json with the offsets of the arrays, followed by its own offset and END_MAGIC
+# Every cell gets a uid when it appears. A tick only stores the cells that appeared (SPAWN), changed their position,
+# mass or kind (UPDATE) or disappeared (DEATH). Every keyframe tick stores all cells as SPAWN events instead, such
+# that a tick can be reconstructed from the last keyframe before it. All arrays can be memory-mapped.
+
+MAGIC = b"AIGARREC"
+END_MAGIC = b"AIGAREND"
+VERSION = 1
+KEYFRAME_INTERVAL = 100
+
+SPAWN = 0
+UPDATE = 1
+DEATH = 2
+
+EVENT_DTYPE = np.dtype([("type", np.uint8), ("kind", np.uint8), ("color", np.uint8, 3), ("owner", np.int16),
+                        ("uid", np.int32), ("x", np.float64), ("y", np.float64), ("mass", np.float64)])
+
+CELL_NAMES = {PELLET: "Pellet", BLOB: "Blob", VIRUS: "Virus"}
+
+
+class AigarRecorder(object):
+    """Writes the ticks of a field into a binary file, see AigarEnv.start_recording"""
+
+    def __init__(self, path, field, num_actions, keyframe_interval=KEYFRAME_INTERVAL):
+        if keyframe_interval < 1:
+            raise ValueError("The keyframe interval has to be at least one tick!")
+        self.field = field
+        self.numActions = num_actions
+        self.keyframeInterval = keyframe_interval
+        self.file = open(path, "wb")
+        header = json.dumps({"field_size": field.size,
+                             "virus_enabled": bool(field.getVirusEnabled()),
+                             "players": [player.getName() for player in field.getPlayers()],
+                             "num_actions": num_actions,
+                             "keyframe_interval": keyframe_interval}).encode()
+        self.file.write(MAGIC + np.array([VERSION, len(header)], dtype=np.uint32).tobytes() + header)
+        self.eventsOffset = self.file.tell()
+        self.numEvents = 0
+        self.eventStarts = []
+        self.keyframes = []
+        self.resets = []
+        self.actions = []
+        self.rewards = []
+        self.ticksSinceKeyframe = 0
+        # Bookkeeping of the cells of the last tick, by uid
+        self.uidOfCells = {}
+        self.cellsOfUids = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.values = np.zeros((0, 3))
+        self.kinds = np.zeros(0, dtype=np.uint8)
+
+    # Records the state of the field after a step (or a reset, if action is None)
+    def recordTick(self, action=None, reward=0, reset=False):
+        keyframe = reset or not self.eventStarts or self.ticksSinceKeyframe >= self.keyframeInterval - 1
+        store = self.field.getCellStore()
+        count = store.getCount()
+        cells = store.views
+        uidOfCells = self.uidOfCells
+        uids = np.fromiter((uidOfCells.get(cell, -1) for cell in cells), dtype=np.int64, count=count)
+        spawned = np.flatnonzero(uids < 0)
+        firstUid = len(self.cellsOfUids)
+        uids[spawned] = np.arange(firstUid, firstUid + len(spawned))
+        for idx in spawned.tolist():
+            cell = cells[idx]
+            uidOfCells[cell] = len(self.cellsOfUids)
+            self.cellsOfUids.append(cell)
+        self.growBookkeeping(len(self.cellsOfUids))
+        alive = np.zeros(len(self.cellsOfUids), dtype=bool)
+        alive[uids] = True
+        died = np.flatnonzero(self.alive & ~alive[:len(self.alive)])
+        for uid in died.tolist():
+            del uidOfCells[self.cellsOfUids[uid]]
+            self.cellsOfUids[uid] = None
+        values = np.empty((count, 3))
+        values[:, :2] = store.pos[:count]
+        values[:, 2] = store.mass[:count]
+        kinds = store.kind[:count].astype(np.uint8)
+        if keyframe:
+            spawned = np.arange(count)
+            updated = spawned[:0]
+            died = died[:0]
+        else:
+            known = np.ones(count, dtype=bool)
+            known[spawned] = False
+            changed = (values != self.values[uids]).any(axis=1) | (kinds != self.kinds[uids])
+            updated = np.flatnonzero(known & changed)
+        events = np.zeros(len(spawned) + len(updated) + len(died), dtype=EVENT_DTYPE)
+        rows = np.concatenate((spawned, updated))
+        events["type"][len(spawned):len(rows)] = UPDATE
+        events["type"][len(rows):] = DEATH
+        events["uid"][:len(rows)] = uids[rows]
+        events["uid"][len(rows):] = died
+        events["kind"][:len(rows)] = kinds[rows]
+        events["owner"][:len(rows)] = store.owner[rows]
+        events["x"][:len(rows)] = values[rows, 0]
+        events["y"][:len(rows)] = values[rows, 1]
+        events["mass"][:len(rows)] = values[rows, 2]
+        events["color"][:len(spawned)] = [cells[idx].getColor() for idx in spawned.tolist()] or np.zeros((0, 3))
+        self.file.write(events.tobytes())
+        self.eventStarts.append(self.numEvents)
+        self.numEvents += len(events)
+        self.keyframes.append(keyframe)
+        self.resets.append(reset)
+        self.actions.append(np.full(self.numActions, np.nan) if action is None else action)
+        self.rewards.append(reward)
+        self.ticksSinceKeyframe = 0 if keyframe else self.ticksSinceKeyframe + 1
+        self.alive = alive
+        self.values[uids] = values
+        self.kinds[uids] = kinds
+
+    def growBookkeeping(self, numUids):
+        if numUids <= len(self.values):
+            return
+        capacity = max(numUids, 2 * len(self.values))
+        values = np.zeros((capacity, 3))
+        values[:len(self.values)] = self.values
+        kinds = np.zeros(capacity, dtype=np.uint8)
+        kinds[:len(self.kinds)] = self.kinds
+        self.values = values
+        self.kinds = kinds
+
+    # Writes the tick table and the footer
+    def close(self):
+        if self.file is None:
+            return
+        arrays = {"event_starts": np.array(self.eventStarts + [self.numEvents], dtype=np.int64),
+                  "keyframes": np.array(self.keyframes, dtype=bool),
+                  "resets": np.array(self.resets, dtype=bool),
+                  "actions": np.array(self.actions, dtype=np.float32).reshape(-1, self.numActions),
+                  "rewards": np.array(self.rewards, dtype=np.float64)}
+        footer = {"num_ticks": len(self.eventStarts),
+                  "num_uids": len(self.cellsOfUids),
+                  "events": [self.eventsOffset, EVENT_DTYPE.descr, [self.numEvents]],
+                  "arrays": {}}
+        for name, array in arrays.items():
+            footer["arrays"][name] = [self.file.tell(), array.dtype.str, list(array.shape)]
+            self.file.write(array.tobytes())
+        footerOffset = self.file.tell()
+        self.file.write(json.dumps(footer).encode())
+        self.file.write(np.array([footerOffset], dtype=np.uint64).tobytes() + END_MAGIC)
+        self.file.close()
+        self.file = None
+
+
+class AigarReplayer(object):
+    """Reconstructs the recorded ticks of an AigarRecorder file in a field, which can be drawn like the field of an
+    env. Seeking forwards from the current tick only applies the events in between, otherwise the field is rebuilt
+    from the last keyframe."""
+
+    def __init__(self, path, rgb_resolution=RGB_RESOLUTION, rgb_backend=RGB_BACKEND):
+        self.path = path
+        self.rgb_resolution = rgb_resolution
+        self.rgb_backend = rgb_backend
+        with open(path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(str(path) + " is not an aigar recording!")
+            version, headerLength = np.frombuffer(file.read(8), dtype=np.uint32)
+            if version != VERSION:
+                raise ValueError("Unsupported recording version " + str(version) + "!")
+            self.header = json.loads(file.read(int(headerLength)))
+            file.seek(-8 - len(END_MAGIC), 2)
+            footerEnd = file.tell()
+            footerOffset = int(np.frombuffer(file.read(8), dtype=np.uint64)[0])
+            if file.read(len(END_MAGIC)) != END_MAGIC:
+                raise ValueError("The recording " + str(path) + " was not closed!")
+            file.seek(footerOffset)
+            footer = json.loads(file.read(footerEnd - footerOffset))
+        self.num_ticks = footer["num_ticks"]
+        offset, descr, shape = footer["events"]
+        self.events = self.memoryMap(offset, np.dtype([tuple(field) for field in descr]), shape)
+        for name, (offset, dtype, shape) in footer["arrays"].items():
+            setattr(self, name, self.memoryMap(offset, np.dtype(dtype), shape))
+        self.keyframeTicks = np.flatnonzero(self.keyframes)
+
+        numUids = footer["num_uids"]
+        self.alive = np.zeros(numUids, dtype=bool)
+        self.kind = np.zeros(numUids, dtype=np.uint8)
+        self.owner = np.zeros(numUids, dtype=np.int64)
+        self.color = np.zeros((numUids, 3), dtype=np.uint8)
+        self.values = np.zeros((numUids, 3))
+        self.tick = None
+
+        self.field = Field(self.header["virus_enabled"])
+        for name in self.header["players"]:
+            self.field.addPlayer(Player(name))
+        self.field.size = self.header["field_size"]
+        self.field.createHashTables()
+        self.rgbGenerator = None
+
+    def memoryMap(self, offset, dtype, shape):
+        if not np.prod(shape):
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=tuple(shape))
+
+    def applyEvents(self, events):
+        created = events[events["type"] == SPAWN]
+        uids = created["uid"]
+        self.alive[uids] = True
+        self.owner[uids] = created["owner"]
+        self.color[uids] = created["color"]
+        self.alive[events["uid"][events["type"] == DEATH]] = False
+        changed = events[events["type"] != DEATH]
+        # Only the last event of every cell counts
+        uids, lastIdxs = np.unique(changed["uid"][::-1], return_index=True)
+        changed = changed[::-1][lastIdxs]
+        self.kind[uids] = changed["kind"]
+        self.values[uids, 0] = changed["x"]
+        self.values[uids, 1] = changed["y"]
+        self.values[uids, 2] = changed["mass"]
+
+    # Puts the cells of the tick into the field and returns the field
+    def seek(self, tick):
+        if not 0 <= tick < self.num_ticks:
+            raise IndexError("Tick " + str(tick) + " is out of range, the recording has " + str(self.num_ticks) +
+                             " ticks!")
+        keyframe = self.keyframeTicks[np.searchsorted(self.keyframeTicks, tick, "right") - 1]
+        if self.tick is None or not keyframe <= self.tick <= tick:
+            self.alive[:] = False
+            self.tick = keyframe - 1
+        self.applyEvents(self.events[self.event_starts[self.tick + 1]:self.event_starts[tick + 1]])
+        self.tick = tick
+        self.buildField()
+        return self.field
+
+    def buildField(self):
+        field = self.field
+        field.clear()
+        store = field.getCellStore()
+        players = field.getPlayers()
+        for player in players:
+            player.cells = []
+        uids = np.flatnonzero(self.alive)
+        kinds = self.kind[uids]
+        for kind in (PELLET, BLOB, VIRUS):
+            kindUids = uids[kinds == kind]
+            colors = map(tuple, self.color[kindUids].tolist())
+            cells = Cell.createMany(store, self.values[kindUids, :2], self.values[kindUids, 2], kind, colors,
+                                    CELL_NAMES[kind])
+            hashTable = {PELLET: field.pelletHashTable, BLOB: field.blobHashTable, VIRUS: field.virusHashTable}[kind]
+            hashTable.insertAllObjects(cells)
+        playerUids = uids[kinds == PLAYER]
+        for uid, (x, y, mass), owner in zip(playerUids.tolist(), self.values[playerUids].tolist(),
+                                            self.owner[playerUids].tolist()):
+            player = players[owner]
+            cell = Cell(x, y, mass, player, store)
+            cell.setColor(tuple(self.color[uid].tolist()))
+            player.color = cell.getColor()
+            player.addCell(cell)
+        for player in players:
+            player.isAlive = bool(player.cells)
+        field.playerHashTable.insertAllObjects(field.getPlayerCells())
+
+    # Draws the view of a player at the tick as rgb image
+    def render(self, tick, player=0, out=None):
+        if self.rgbGenerator is None:
+            from aigar.envs.aigarEnv import createRGBGenerator
+            self.rgbGenerator = createRGBGenerator(self.field, None, self.rgb_resolution, self.rgb_backend)
+        self.seek(tick)
+        return self.rgbGenerator.get_cnn_inputRGB(self.field.getPlayers()[player], out)
+
+    def getField(self):
+        return self.field
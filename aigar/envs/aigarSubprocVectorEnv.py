@@ -0,0 +1,203 @@
+import multiprocessing
+import os
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from aigar.envs.aigarVectorEnv import AigarVectorEnv
+
+# The subprocess vector env distributes the fields over several worker processes, each of which steps its share of
+# fields with an AigarVectorEnv.
+# All bulk data is exchanged through shared memory: the parent writes the actions into a shared buffer and the
+# workers write observations, rewards and dones directly into shared buffers. The pipes to the workers only carry
+# short commands. The observations are written into a ring of num_slots buffers, such that the observations that were
+# returned by a step stay valid for the next num_slots - 1 steps without being copied.
+
+
+def attachBuffer(name, shape, dtype):
+    sharedMemory = shared_memory.SharedMemory(name=name)
+    return sharedMemory, np.ndarray(shape, dtype=dtype, buffer=sharedMemory.buf)
+
+
+def runWorker(pipe, firstEnvNr, numEnvs, kwargs):
+    sharedMemories = []
+    envNrs = slice(firstEnvNr, firstEnvNr + numEnvs)
+    try:
+        vectorEnv = AigarVectorEnv(numEnvs, **kwargs)
+        pipe.send((vectorEnv.observation_space, vectorEnv.action_space))
+        buffers = {}
+        for name, (memoryName, shape, dtype) in pipe.recv().items():
+            sharedMemory, buffer = attachBuffer(memoryName, shape, dtype)
+            sharedMemories.append(sharedMemory)
+            # Every worker only touches the rows of its own fields, which are a contiguous block
+            buffers[name] = buffer[:, envNrs] if name in ("states", "terminalStates") else buffer[envNrs]
+        while True:
+            command, slot, data = pipe.recv()
+            if command == "step":
+                states, rewards, dones, infos = vectorEnv.step(buffers["actions"], out=buffers["states"][slot])
+                buffers["rewards"][:] = rewards
+                buffers["dones"][:] = dones
+                for envNr in np.flatnonzero(dones):
+                    buffers["terminalStates"][slot, envNr] = infos[envNr]["terminal_observation"]
+            elif command == "reset":
+                vectorEnv.reset(out=buffers["states"][slot])
+            elif command == "seed":
+                vectorEnv.seed(data)
+            elif command == "close":
+                vectorEnv.close()
+                pipe.send(None)
+                break
+            pipe.send(None)
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        pipe.send(traceback.format_exc())
+    finally:
+        for sharedMemory in sharedMemories:
+            sharedMemory.close()
+
+
+class AigarSubprocVectorEnv(object):
+    """Steps num_envs aigar fields in num_workers processes. Takes the same options as AigarEnv"""
+
+    def __init__(self, num_envs, num_workers=None, num_slots=2, start_method=None, **kwargs):
+        if num_envs < 1:
+            raise ValueError("The vector env needs at least one field!")
+        if num_slots < 1:
+            raise ValueError("The vector env needs at least one observation slot!")
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        num_workers = min(num_workers, num_envs)
+        self.num_envs = num_envs
+        self.num_workers = num_workers
+        self.num_slots = num_slots
+        self.rgb = kwargs.get("rgb", False)
+        self.slot = 0
+        self.waiting = False
+        self.closed = False
+        self.sharedMemories = []
+        self.buffers = {}
+
+        context = multiprocessing.get_context(start_method)
+        # The workers have to share the resource tracker of the parent, otherwise the tracker of a worker unlinks the
+        # shared buffers when the worker exits
+        resource_tracker.ensure_running()
+        self.pipes = []
+        self.processes = []
+        self.envNrsOfWorkers = []
+        for envNrs in np.array_split(np.arange(num_envs), num_workers):
+            self.envNrsOfWorkers.append(slice(int(envNrs[0]), int(envNrs[-1]) + 1))
+            pipe, workerPipe = context.Pipe()
+            process = context.Process(target=runWorker, args=(workerPipe, envNrs[0], len(envNrs), kwargs),
+                                      daemon=True)
+            process.start()
+            workerPipe.close()
+            self.pipes.append(pipe)
+            self.processes.append(process)
+        self.observation_space, self.action_space = self.receiveAll()[0]
+        self.num_actions = len(self.action_space.low)
+        self.createBuffers()
+
+    def createBuffers(self):
+        obsShape = (self.num_slots, self.num_envs) + self.observation_space.shape
+        # The grid observations are computed in float64, like the ones of AigarEnv
+        obsType = np.uint8 if self.rgb else np.float64
+        layout = {"states": (obsShape, obsType),
+                  "terminalStates": (obsShape, obsType),
+                  "actions": ((self.num_envs, self.num_actions), np.float64),
+                  "rewards": ((self.num_envs,), np.float64),
+                  "dones": ((self.num_envs,), np.bool_)}
+        bufferNames = {}
+        for name, (shape, dtype) in layout.items():
+            dtype = np.dtype(dtype)
+            size = max(1, int(np.prod(shape)) * dtype.itemsize)
+            sharedMemory = shared_memory.SharedMemory(create=True, size=size)
+            self.sharedMemories.append(sharedMemory)
+            self.buffers[name] = np.ndarray(shape, dtype=dtype, buffer=sharedMemory.buf)
+            bufferNames[name] = (sharedMemory.name, shape, dtype)
+        for pipe in self.pipes:
+            pipe.send(bufferNames)
+
+    def receiveAll(self):
+        results = [pipe.recv() for pipe in self.pipes]
+        for result in results:
+            if isinstance(result, str):
+                self.close()
+                raise RuntimeError("An aigar worker failed:\n" + result)
+        return results
+
+    def sendAll(self, command, dataPerWorker=None):
+        for workerNr, pipe in enumerate(self.pipes):
+            data = None if dataPerWorker is None else dataPerWorker[workerNr]
+            pipe.send((command, self.slot, data))
+
+    def advanceSlot(self):
+        self.slot = (self.slot + 1) % self.num_slots
+
+    # Gives every field the same random stream as AigarVectorEnv.seed does
+    def seed(self, seed=None):
+        if isinstance(seed, (list, tuple)):
+            seeds = list(seed)
+        else:
+            seeds = np.random.SeedSequence(seed).spawn(self.num_envs)
+        if len(seeds) != self.num_envs:
+            raise ValueError("Got " + str(len(seeds)) + " seeds for " + str(self.num_envs) + " fields!")
+        self.sendAll("seed", [seeds[envNrs.start:envNrs.stop] for envNrs in self.envNrsOfWorkers])
+        self.receiveAll()
+        return seeds
+
+    # The returned observations are views into shared memory, they are overwritten after num_slots further steps
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed(seed)
+        self.advanceSlot()
+        self.sendAll("reset")
+        self.receiveAll()
+        return self.buffers["states"][self.slot]
+
+    def step_async(self, actions):
+        actions = np.asarray(actions)
+        if actions.shape != (self.num_envs, self.num_actions):
+            raise TypeError("The actions need to have the shape (num_envs, num_actions) = " +
+                            str((self.num_envs, self.num_actions)) + ", got " + str(actions.shape) + "!")
+        self.buffers["actions"][:] = actions
+        self.advanceSlot()
+        self.sendAll("step")
+        self.waiting = True
+
+    def step_wait(self):
+        self.receiveAll()
+        self.waiting = False
+        dones = self.buffers["dones"].copy()
+        infos = [{} for _ in range(self.num_envs)]
+        for envNr in np.flatnonzero(dones):
+            infos[envNr]["terminal_observation"] = self.buffers["terminalStates"][self.slot, envNr].copy()
+        return self.buffers["states"][self.slot], self.buffers["rewards"].copy(), dones, infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for pipe, process in zip(self.pipes, self.processes):
+            if process.is_alive():
+                try:
+                    if self.waiting:
+                        pipe.recv()
+                    pipe.send(("close", None, None))
+                    pipe.recv()
+                except (OSError, EOFError):
+                    pass
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            pipe.close()
+        self.buffers = {}
+        for sharedMemory in self.sharedMemories:
+            sharedMemory.close()
+            sharedMemory.unlink()
+        self.sharedMemories = []
@@ -0,0 +1,101 @@
+import numpy as np
+
+from aigar.envs.aigarEnv import AigarEnv
+from aigar.envs.model.bot import getGridStateRepresentations, makeGreedyMoves
+
+# The vector env runs several independent fields in lockstep within one process.
+# Each field has its own gym bot, the actions of all gym bots are passed as one batch and the observations,
+# rewards and dones of all fields are returned stacked. The decisions of the greedy bots of all fields are made in one
+# batched pass per tick, and the grid observations of all fields are built together, such that every grid channel is
+# binned in one pass over the cells of all fields. Nothing else is batched across fields: every field owns its cell
+# store and hash tables, and its physics, collisions and spawning are updated on their own in a python loop.
+# Fields whose gym bot died are reset automatically.
+# The observations can be written into a given buffer (e.g. shared memory) instead of a new array.
+
+class AigarVectorEnv(object):
+    """Steps num_envs aigar fields in lockstep. Takes the same options as AigarEnv. Only the greedy bot decisions and the
+    grid observations are batched across fields, the field updates run once per field"""
+
+    def __init__(self, num_envs, **kwargs):
+        if num_envs < 1:
+            raise ValueError("The vector env needs at least one field!")
+        self.num_envs = num_envs
+        self.envs = [AigarEnv(**kwargs) for _ in range(num_envs)]
+        self.gym_bots = [env.gym_bot for env in self.envs]
+        self.rgb = self.envs[0].rgb
+        # Spaces of a single field:
+        self.action_space = self.envs[0].action_space
+        self.observation_space = self.envs[0].observation_space
+        self.num_actions = self.envs[0].num_actions
+        self.frame_skip = self.envs[0].frame_skip
+
+    def step(self, actions, out=None):
+        actions = np.asarray(actions)
+        if actions.shape != (self.num_envs, self.num_actions):
+            raise TypeError("The actions need to have the shape (num_envs, num_actions) = " +
+                            str((self.num_envs, self.num_actions)) + ", got " + str(actions.shape) + "!")
+        rewards = np.zeros(self.num_envs)
+        running = list(range(self.num_envs))
+        # The fields advance tick by tick in lockstep, the greedy bots of all fields decide in one batched pass per tick
+        for tick in range(self.frame_skip):
+            makeGreedyMoves([bot for envNr in running for bot in self.envs[envNr].getLivingGreedyBots()])
+            for envNr in running:
+                rewards[envNr] += self.envs[envNr].updateTick(actions[envNr], tick, greedyMovesMade=True)
+            running = [envNr for envNr in running if self.gym_bots[envNr].player.getIsAlive()]
+        states = self.get_states(out=out)
+        dones = np.array([not bot.player.getIsAlive() for bot in self.gym_bots])
+        infos = [{} for _ in range(self.num_envs)]
+        doneEnvNrs = np.flatnonzero(dones)
+        if len(doneEnvNrs):
+            # The observation of a finished field is handed out in its info, the field continues from a reset
+            for envNr in doneEnvNrs:
+                infos[envNr]["terminal_observation"] = states[envNr].copy()
+                self.envs[envNr].resetModel()
+            states[doneEnvNrs] = self.get_states(doneEnvNrs)
+        return states, rewards, dones, infos
+
+    # Gives every field its own random stream derived from seed. Also takes a list with one seed per field.
+    def seed(self, seed=None):
+        if isinstance(seed, (list, tuple)):
+            seeds = seed
+        else:
+            seeds = np.random.SeedSequence(seed).spawn(self.num_envs)
+        if len(seeds) != self.num_envs:
+            raise ValueError("Got " + str(len(seeds)) + " seeds for " + str(self.num_envs) + " fields!")
+        for env, envSeed in zip(self.envs, seeds):
+            env.seed(envSeed)
+        return list(seeds)
+
+    def reset(self, seed=None, out=None):
+        if seed is not None:
+            self.seed(seed)
+        for env in self.envs:
+            env.resetModel()
+        return self.get_states(out=out)
+
+    def get_states(self, envNrs=None, out=None):
+        if envNrs is None:
+            envNrs = range(self.num_envs)
+        if self.rgb:
+            if out is None:
+                out = np.empty((len(envNrs),) + self.observation_space.shape, dtype=np.uint8)
+            for envNr, envOut in zip(envNrs, out):
+                self.envs[envNr].get_state(out=envOut)
+            return out
+        bots = [self.gym_bots[envNr] for envNr in envNrs]
+        states = getGridStateRepresentations(bots)
+        if out is None:
+            return states
+        out[:] = states
+        return out
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+    # Getters:
+    def getEnvs(self):
+        return self.envs
+
+    def getFields(self):
+        return [env.getField() for env in self.envs]
@@ -1,7 +1,8 @@
 import numpy
 
+from .cellStore import PELLET
 from .parameters import *
-from .spatialHashTable import SpatialHashTable
+from .spatialHashTable import getIdsForAreasFloatingPoint
 
 
 def isCellData(cell):
@@ -21,6 +22,178 @@ def getRelativeCellPos(cell, left, top, size):
         return [0, 0]
 
 
+# Bins the masses of the given cells into the grid squares of the fovs of the bots. A cell counts for every grid
+# square that its bounding box touches. The masses within a grid square are combined with the given ufunc (numpy.add
+# sums them up in the order of the cells, numpy.maximum keeps the biggest one).
+# cellsPerBot holds a list of cells for every bot, the cells of a bot have to live in the cell store of its field.
+# Grid squares outside of the field stay empty.
+def getGridsOfCells(bots, cellsPerBot, left, top, fovSize, gsSize, outsideField, ufunc):
+    gridSquaresPerFov = bots[0].gridSquaresPerFov
+    grids = numpy.zeros(outsideField.shape)
+    botNrs = [botNr for botNr, cells in enumerate(cellsPerBot) if cells]
+    if not botNrs:
+        return grids
+    # The squares of a bot are laid out like the buckets of a SpatialHashTable over its fov
+    cols = numpy.ceil(fovSize / gsSize).astype(numpy.int64)
+    numBuckets = max(int(cols.max()) ** 2, gridSquaresPerFov * gridSquaresPerFov)
+    idxs = []
+    stores = []
+    for botNr in botNrs:
+        idxs.append(numpy.array([cell.storeIdx for cell in cellsPerBot[botNr]]))
+        stores.append(bots[botNr].field.getCellStore())
+    pos = numpy.concatenate([store.pos[botIdxs] for store, botIdxs in zip(stores, idxs)])
+    radius = numpy.concatenate([store.radius[botIdxs] for store, botIdxs in zip(stores, idxs)])
+    mass = numpy.concatenate([store.mass[botIdxs] for store, botIdxs in zip(stores, idxs)])
+    cellBots = numpy.repeat(botNrs, [len(botIdxs) for botIdxs in idxs])
+    cellNrs, squareIds = getIdsForAreasFloatingPoint(pos[:, 0], pos[:, 1], radius, left[cellBots], top[cellBots],
+                                                     fovSize[cellBots], gsSize[cellBots], cols[cellBots])
+    squares = numpy.zeros((len(bots), numBuckets))
+    ufunc.at(squares.reshape(-1), squareIds + cellBots[cellNrs] * numBuckets, mass[cellNrs])
+    grids.reshape(len(bots), -1)[:] = squares[:, :gridSquaresPerFov * gridSquaresPerFov]
+    grids[outsideField] = 0
+    return grids
+
+
+# Builds the grid observations of several bots at once, every channel is binned with one pass over the cells of all
+# bots. The bots may live on different fields, but they have to share the same observation layout.
+def getGridStateRepresentations(bots):
+    bot = bots[0]
+    gridSquaresPerFov = bot.gridSquaresPerFov
+    # Get Fov infomation
+    fieldSize = numpy.array([bot.field.getWidth() for bot in bots])
+    fovSize = numpy.array([bot.player.getFovSize() for bot in bots], dtype=float)
+    fovPos = numpy.array([bot.player.getFovPos() for bot in bots], dtype=float)
+    left = fovPos[:, 0] - fovSize / 2
+    top = fovPos[:, 1] - fovSize / 2
+    gsSize = fovSize / gridSquaresPerFov  # (gs = grid square)
+
+    # Midpoints of the grid square columns and rows, accumulated like the grid squares are traversed
+    squareSteps = numpy.repeat(gsSize[:, None], gridSquaresPerFov, axis=1)
+    squareSteps[:, 0] = left + gsSize / 2
+    gsMidPointsX = numpy.add.accumulate(squareSteps, axis=1)
+    squareSteps[:, 0] = top + gsSize / 2
+    gsMidPointsY = numpy.add.accumulate(squareSteps, axis=1)
+    halvedGsSize = (gsSize / 2)[:, None]
+    fieldSize = fieldSize[:, None]
+
+    # Only check for cells if the grid square fov is within the playing field
+    inFieldX = ~((gsMidPointsX + halvedGsSize < 0) | (gsMidPointsX - halvedGsSize > fieldSize))
+    inFieldY = ~((gsMidPointsY + halvedGsSize < 0) | (gsMidPointsY - halvedGsSize > fieldSize))
+    outsideField = ~(inFieldY[:, :, None] & inFieldX[:, None, :])
+
+    # Create pellet representation
+    pellets = [bot.field.getPelletsInFov(fovPos[botNr], fovSize[botNr]) for botNr, bot in enumerate(bots)]
+    gsPelletMass = getGridsOfCells(bots, pellets, left, top, fovSize, gsSize, outsideField, numpy.add)
+    # Create Enemy Cell mass representation
+    enemyCells = [bot.field.getEnemyPlayerCellsInFov(bot.player) for bot in bots]
+    gsBiggestEnemyCellMass = getGridsOfCells(bots, enemyCells, left, top, fovSize, gsSize, outsideField,
+                                             numpy.maximum)
+    # Create Own Cell mass representation
+    playerCells = [bot.field.getPortionOfCellsInFov(bot.player.getCells(), fovPos[botNr], fovSize[botNr])
+                   for botNr, bot in enumerate(bots)]
+    gsBiggestOwnCellMass = getGridsOfCells(bots, playerCells, left, top, fovSize, gsSize, outsideField,
+                                           numpy.maximum)
+    # Create Virus Cell representation
+    gsVirus = None
+    if bot.virus_enabled:
+        virusCells = [bot.field.getVirusesInFov(fovPos[botNr], fovSize[botNr]) if bot.field.getVirusEnabled() else []
+                      for botNr, bot in enumerate(bots)]
+        gsVirus = getGridsOfCells(bots, virusCells, left, top, fovSize, gsSize, outsideField, numpy.maximum)
+
+    # Create Wall representation
+    # Calculate how much of the grid square is covered by walls. The free area of a grid square is the product
+    # of the free width of its column and the free height of its row.
+    leftBorders = numpy.minimum(numpy.maximum(gsMidPointsX - halvedGsSize, 0), fieldSize)
+    rightBorders = numpy.maximum(numpy.minimum(gsMidPointsX + halvedGsSize, fieldSize), 0)
+    topBorders = numpy.minimum(numpy.maximum(gsMidPointsY - halvedGsSize, 0), fieldSize)
+    bottomBorders = numpy.maximum(numpy.minimum(gsMidPointsY + halvedGsSize, fieldSize), 0)
+    freeArea = (rightBorders - leftBorders)[:, None, :] * (bottomBorders - topBorders)[:, :, None]
+    # Squared as scalars, numpy squares arrays with a multiplication which can differ from pow in the last bit
+    gsArea = numpy.array([size ** 2 for size in gsSize])
+    gsWalls = numpy.round(1 - (freeArea / gsArea[:, None, None]), 3)
+
+    grids = []
+    if PELLET_GRID:
+        grids.append(gsPelletMass)
+    if SELF_GRID:
+        grids.append(gsBiggestOwnCellMass)
+    if WALL_GRID:
+        grids.append(gsWalls)
+    if bot.use_enemy_grid:
+        grids.append(gsBiggestEnemyCellMass)
+    if bot.virus_enabled:
+        grids.append(gsVirus)
+    return numpy.stack(grids, axis=-1)
+
+
+# Makes the decisions of several greedy bots at once, the bots can belong to different fields (e.g. the fields of a
+# vector env). Every bot targets the visible cell with the highest mass / squared distance to its biggest cell, among
+# the pellets, the enemy cells and the viruses (if enabled) that its biggest cell can eat. The candidates of all bots
+# are gathered field by field and then filtered and scored with one array computation, a bot takes the first of its
+# best candidates in the order pellets, enemy cells, viruses. Bots without candidates move randomly.
+def makeGreedyMoves(bots):
+    if not bots:
+        return
+    numBots = len(bots)
+    fovPos = numpy.empty((numBots, 2))
+    fovSize = numpy.empty(numBots)
+    playerIds = numpy.empty(numBots, dtype=numpy.int64)
+    biggestPos = numpy.empty((numBots, 2))
+    biggestMass = numpy.empty(numBots)
+    fovs = []
+    candidates = []
+    botNrsOfFields = {}
+    for botNr, bot in enumerate(bots):
+        player = bot.player
+        store = bot.field.getCellStore()
+        botFovPos = player.getFovPos()
+        botFovSize = player.getFovSize()
+        fovs.append((botFovPos, botFovSize))
+        fovPos[botNr] = botFovPos
+        fovSize[botNr] = botFovSize
+        playerIds[botNr] = player.getId()
+        cellIdxs = player.getCellIdxs()
+        biggestIdx = cellIdxs[store.mass[cellIdxs].argmax()]
+        biggestPos[botNr] = store.pos[biggestIdx]
+        biggestMass[botNr] = store.mass[biggestIdx]
+        candidates.append(bot.field.getIdxsNearFov(botFovPos, botFovSize))
+        botNrsOfFields.setdefault(bot.field, []).append(botNr)
+    columns = {"pairBots": [], "idxs": [], "pos": [], "radius": [], "mass": [], "kind": [], "owner": []}
+    for field, botNrs in botNrsOfFields.items():
+        store = field.getCellStore()
+        fieldIdxs = numpy.concatenate([candidates[botNr] for botNr in botNrs]).astype(numpy.int64)
+        columns["pairBots"].append(numpy.repeat(botNrs, [len(candidates[botNr]) for botNr in botNrs]))
+        columns["idxs"].append(fieldIdxs)
+        for name in ("pos", "radius", "mass", "kind", "owner"):
+            columns[name].append(getattr(store, name)[fieldIdxs])
+    pairBots, idxs, pos, radius, mass, kind, owner = [numpy.concatenate(column) for column in columns.values()]
+    x = pos[:, 0]
+    y = pos[:, 1]
+    halvedFovSize = fovSize[pairBots] / 2
+    fovX = fovPos[pairBots, 0]
+    fovY = fovPos[pairBots, 1]
+    outside = (x + radius < fovX - halvedFovSize) | (x - radius > fovX + halvedFovSize) | \
+              (y + radius < fovY - halvedFovSize) | (y - radius > fovY + halvedFovSize)
+    # Pellets can always be eaten, other cells only if they are not the bot's own and its biggest cell can eat them
+    edible = (kind == PELLET) | ((owner != playerIds[pairBots]) & (biggestMass[pairBots] > 1.25 * mass))
+    edible &= ~outside
+    pairs = numpy.flatnonzero(edible)
+    pairBots = pairBots[pairs]
+    xDiff = x[pairs] - biggestPos[pairBots, 0]
+    yDiff = y[pairs] - biggestPos[pairBots, 1]
+    squaredDistance = xDiff * xDiff + yDiff * yDiff
+    score = mass[pairs] / numpy.where(squaredDistance != 0, squaredDistance, 1)
+    bestScore = numpy.full(numBots, -numpy.inf)
+    numpy.maximum.at(bestScore, pairBots, score)
+    isBest = numpy.flatnonzero(score == bestScore[pairBots])
+    botsWithTarget, firstBest = numpy.unique(pairBots[isBest], return_index=True)
+    targets = numpy.full(numBots, -1)
+    targets[botsWithTarget] = idxs[pairs[isBest[firstBest]]]
+
+    for bot, target, (botFovPos, botFovSize) in zip(bots, targets.tolist(), fovs):
+        bot.setGreedyTarget(target, botFovPos, botFovSize)
+
+
 class Bot(object):
     _greedyId = 0
     _nnId = 0
@@ -94,9 +267,8 @@ class Bot(object):
         self.player = player
         self.field = field
         self.time = 0
-        if self.type == "Greedy":
-            self.splitLikelihood = numpy.random.randint(9950, 10000)
-            self.ejectLikelihood = 100000  # numpy.random.randint(9990,10000)
+        self.splitLikelihood = None
+        self.ejectLikelihood = None
         self.totalMasses = []
         self.memories = []
         self.secondLastSelfGrid = None
@@ -125,9 +297,24 @@ class Bot(object):
         
         if self.type == "Greedy" or self.type == "Random":
             self.currentAction = [0, 0, 0, 0]
+        # Drawn on every reset, such that a reseeded field reproduces its bots
+        if self.type == "Greedy":
+            self.splitLikelihood = self.field.getRng().integers(9950, 10000)
+            self.ejectLikelihood = 100000  # self.field.getRng().integers(9990,10000)
 
         self.experiences = []
 
+    # Only the state that influences the following actions and rewards is captured, not the logged masses
+    def snapshot(self):
+        currentAction = None if self.currentAction is None else self.currentAction.copy()
+        return (self.lastMass, self.lastReward, self.cumulativeReward, currentAction, self.splitLikelihood,
+                self.ejectLikelihood, self.time, self.currentlySkipping)
+
+    def restore(self, snapshot):
+        self.lastMass, self.lastReward, self.cumulativeReward, currentAction, self.splitLikelihood, \
+            self.ejectLikelihood, self.time, self.currentlySkipping = snapshot
+        self.currentAction = None if currentAction is None else currentAction.copy()
+
     def updateRewards(self):
         self.cumulativeReward += self.getReward() if self.lastMass else 0
         self.lastReward = self.cumulativeReward
@@ -163,19 +350,21 @@ class Bot(object):
 
     def make_random_bot_move(self):
         if self.time % self.parameters.FRAME_SKIP_RATE == 0:
-            self.currentAction[0] = numpy.random.random()
-            self.currentAction[1] = numpy.random.random()
-            self.currentAction[2] = numpy.random.random() if ENABLE_SPLIT else False
-            self.currentAction[3] = numpy.random.random() if ENABLE_EJECT else False
+            rng = self.field.getRng()
+            self.currentAction[0] = rng.random()
+            self.currentAction[1] = rng.random()
+            self.currentAction[2] = rng.random() if ENABLE_SPLIT else False
+            self.currentAction[3] = rng.random() if ENABLE_EJECT else False
         self.time += 1
 
-    def makeMove(self, action=None):
+    # greedyMoveMade is set if the greedy bot's decision was already made by makeGreedyMoves
+    def makeMove(self, action=None, greedyMoveMade=False):
         self.totalMasses.append(self.player.getTotalMass())
 
         if not self.player.getIsAlive():
             return
 
-        if self.type == "Greedy":
+        if self.type == "Greedy" and not greedyMoveMade:
             self.make_greedy_bot_move()
 
         if self.type == "Random":
@@ -252,139 +441,7 @@ class Bot(object):
         return (self.gridSquaresPerFov, self.gridSquaresPerFov, self.num_grids)
 
     def getGridStateRepresentation(self):
-        # Get Fov infomation
-        fieldSize = self.field.getWidth()
-        fovSize = self.player.getFovSize()
-        fovPos = self.player.getFovPos()
-        x = fovPos[0]
-        y = fovPos[1]
-        left = x - fovSize / 2
-        top = y - fovSize / 2
-        # Initialize spatial hash tables:
-        gridSquaresPerFov = self.gridSquaresPerFov
-        gsSize = fovSize / gridSquaresPerFov  # (gs = grid square)
-
-        pelletSHT = SpatialHashTable(fovSize, gsSize, left, top)  # SHT = spatial hash table
-        totalPellets = self.field.getPelletsInFov(fovPos, fovSize)
-        pelletSHT.insertAllFloatingPointObjects(totalPellets)
-
-        enemyCells = self.field.getEnemyPlayerCellsInFov(self.player)
-        playerCells = self.field.getPortionOfCellsInFov(self.player.getCells(), fovPos, fovSize)
-        allPlayerSHT = None
-        playerSHT = None
-        enemySHT = None
-        
-        playerSHT = SpatialHashTable(fovSize, gsSize, left, top)
-        playerSHT.insertAllFloatingPointObjects(playerCells)
-        enemySHT = SpatialHashTable(fovSize, gsSize, left, top)
-        enemySHT.insertAllFloatingPointObjects(enemyCells)
-
-        virusSHT = None
-        if self.field.getVirusEnabled():
-            virusSHT = SpatialHashTable(fovSize, gsSize, left, top)
-            virusCells = self.field.getVirusesInFov(fovPos, fovSize)
-            virusSHT.insertAllFloatingPointObjects(virusCells)
-
-        # Calculate mass of biggest cell:
-        #if self.parameters.NORMALIZE_GRID_BY_MAX_MASS:
-        #    allCells = numpy.concatenate((playerCells, enemyCells))
-        #    biggestCellMass = max(allCells, key = lambda cell: cell.getMass()).getMass()
-
-        # Initialize grid squares with zeros:
-        gsPelletMass = numpy.zeros((gridSquaresPerFov, gridSquaresPerFov))
-        gsWalls = numpy.zeros((gridSquaresPerFov, gridSquaresPerFov))
-        gsBiggestAllCellMass = None
-        gsBiggestEnemyCellMass = None
-        gsBiggestOwnCellMass = None
-        #if self.parameters.ALL_PLAYER_GRID:
-        #    gsBiggestAllCellMass = numpy.zeros((gridSquaresPerFov, gridSquaresPerFov))
-        #else:
-        gsBiggestEnemyCellMass = numpy.zeros((gridSquaresPerFov, gridSquaresPerFov))
-        gsBiggestOwnCellMass = numpy.zeros((gridSquaresPerFov, gridSquaresPerFov))
-        gsVirus = None
-        if self.virus_enabled:
-            gsVirus = numpy.zeros((gridSquaresPerFov, gridSquaresPerFov))
-
-        gridView = numpy.zeros(self.getObsSize())
-        # gsMidPoint is adjusted in the loops
-        gsMidPoint = [left + gsSize / 2, top + gsSize / 2]
-        for c in range(gridSquaresPerFov):
-            for r in range(gridSquaresPerFov):
-                count = r + c * gridSquaresPerFov
-                # Only check for cells if the grid square fov is within the playing field
-                if not (gsMidPoint[0] + gsSize / 2 < 0 or gsMidPoint[0] - gsSize / 2 > fieldSize or
-                        gsMidPoint[1] + gsSize / 2 < 0 or gsMidPoint[1] - gsSize / 2 > fieldSize):
-                    # Create pellet representation
-                    # Make the visionGrid's pellet count a percentage so that the network doesn't have to
-                    # work on interpreting the number of pellets relative to the size (and Fov) of the player
-                    pelletMassSum = 0
-                    pelletsInGS = pelletSHT.getBucketContent(count)
-                    if pelletsInGS:
-                        for pellet in pelletsInGS:
-                            pelletMassSum += pellet.getMass()
-                            if NORMALIZE_GRID_BY_MAX_MASS:
-                                pelletMassSum /= biggestCellMass
-                        gsPelletMass[c][r] = pelletMassSum
-                    # Create Enemy Cell mass representation
-                    # Make the visionGrid's enemy cell representation a percentage. The player's cell mass
-                    # in proportion to the biggest enemy cell's mass in each grid square.
-                    enemiesInGS = enemySHT.getBucketContent(count)
-                    if enemiesInGS:
-                        biggestEnemyInGSMass = max(enemiesInGS, key=lambda cell: cell.getMass()).getMass()
-                        if NORMALIZE_GRID_BY_MAX_MASS:
-                            biggestEnemyInGSMass /= biggestCellMass
-                        gsBiggestEnemyCellMass[c][r] = biggestEnemyInGSMass
-
-                    # Create Own Cell mass representation
-                    playerCellsInGS = playerSHT.getBucketContent(count)
-                    if playerCellsInGS:
-                        biggestFriendInGSMass = max(playerCellsInGS, key=lambda cell: cell.getMass()).getMass()
-                        if NORMALIZE_GRID_BY_MAX_MASS:
-                            biggestFriendInGSMass /= biggestCellMass
-                        gsBiggestOwnCellMass[c][r] = biggestFriendInGSMass
-
-                    # Create Virus Cell representation
-                    if self.field.getVirusEnabled():
-                        virusesInGS = virusSHT.getBucketContent(count)
-                        if virusesInGS:
-                            biggestVirus = max(virusesInGS, key=lambda virus: virus.getRadius()).getMass()
-                            if NORMALIZE_GRID_BY_MAX_MASS:
-                                biggestVirus /= biggestCellMass
-                            gsVirus[c][r] = biggestVirus
-
-                # Create Wall representation
-                # Calculate how much of the grid square is covered by walls
-                leftBorder = min(max(gsMidPoint[0] - gsSize / 2, 0), fieldSize)
-                topBorder = min(max(gsMidPoint[1] - gsSize / 2, 0), fieldSize)
-                rightBorder = max(min(gsMidPoint[0] + gsSize / 2, fieldSize), 0)
-                bottomBorder = max(min(gsMidPoint[1] + gsSize / 2, fieldSize), 0)
-                freeArea = (rightBorder - leftBorder) * (bottomBorder - topBorder)
-                gsWalls[c][r] = round(1 - (freeArea / (gsSize ** 2)), 3)
-
-                # Increment grid square position horizontally
-                gsMidPoint[0] += gsSize
-            # Reset horizontal grid square, increment grid square position
-            gsMidPoint[0] = left + gsSize / 2
-            gsMidPoint[1] += gsSize
-
-        count = 0
-        if PELLET_GRID:
-            gridView[:, :, count] = gsPelletMass
-            count += 1
-        if SELF_GRID:
-            gridView[:, :, count] = gsBiggestOwnCellMass
-            count += 1
-        if WALL_GRID:
-            gridView[:, :, count] = gsWalls
-            count += 1
-        if self.use_enemy_grid:
-            gridView[:, :, count] = gsBiggestEnemyCellMass
-            count += 1
-        if self.virus_enabled:
-            gridView[:, :, count] = gsVirus
-            count += 1            
-        return gridView
-
+        return getGridStateRepresentations([self])[0]
 
     def getCoorConvGrids(self):
         dims = (self.gridSquaresPerFov, self.gridSquaresPerFov)
@@ -466,60 +523,29 @@ class Bot(object):
         self.player.setCommands(xChoice, yChoice, splitChoice, ejectChoice)
 
     def make_greedy_bot_move(self):
-        midPoint = self.player.getFovPos()
-        size = self.player.getFovSize()
-        x = int(midPoint[0])
-        y = int(midPoint[1])
-        left = x - int(size / 2)
-        top = y - int(size / 2)
-
-        cellsInFov = self.field.getPelletsInFov(midPoint, size)
-        playerCells = self.player.getCells()
-        biggestPlayerCell = max(playerCells, key=lambda p: p.getMass())
-        # If the bot is split, use its biggest cell as reference
-        if len(playerCells) > 1:
-            biggestCellMass = biggestPlayerCell.getMass()
-            for playerCell in playerCells:
-                playerCellMass = playerCell.getMass()
-                if biggestCellMass < playerCellMass:
-                    biggestPlayerCell = playerCell
-                    biggestCellMass = playerCellMass
-
-        playerCellsInFov = self.field.getEnemyPlayerCellsInFov(self.player)
-        for opponentCell in playerCellsInFov:
-            # If the single celled bot can eat the opponent cell add it to list
-            if biggestPlayerCell.getMass() > 1.25 * opponentCell.getMass():
-                cellsInFov.append(opponentCell)
-
-        if self.field.getVirusEnabled():
-            virusCellsInFov = self.field.getVirusesInFov(midPoint, size)
-            for virus in virusCellsInFov:
-                # If the single celled bot can eat the opponent cell add it to list
-                if biggestPlayerCell.getMass() > 1.25 * virus.getMass():
-                    cellsInFov.append(virus)
-
-        if cellsInFov:
-            bestCell = max(cellsInFov, key=lambda p: p.getMass() / (
-                p.squaredDistance(biggestPlayerCell) if p.squaredDistance(biggestPlayerCell) != 0 else 1))
-            bestCellPos = getRelativeCellPos(bestCell, left, top, size)
-            self.currentAction[0] = bestCellPos[0]
-            self.currentAction[1] = bestCellPos[1]
+        makeGreedyMoves([self])
+
+    # Moves towards the cell in the given row of the cell store, or randomly if the row is negative. The target is
+    # given relative to the fov of the player.
+    def setGreedyTarget(self, targetIdx, midPoint, size):
+        if targetIdx >= 0:
+            left = int(midPoint[0]) - int(size / 2)
+            top = int(midPoint[1]) - int(size / 2)
+            store = self.field.getCellStore()
+            self.currentAction[0] = round((store.pos.item(targetIdx, 0) - left) / size, 5)
+            self.currentAction[1] = round((store.pos.item(targetIdx, 1) - top) / size, 5)
         else:
-            size = int(size / 2)
-            self.currentAction[0] = numpy.random.random()
-            self.currentAction[1] = numpy.random.random()
+            self.currentAction[0] = self.field.getRng().random()
+            self.currentAction[1] = self.field.getRng().random()
         self.currentAction[2] = False
         self.currentAction[3] = False
         if ENABLE_GREEDY_SPLIT:
-            randNumSplit = numpy.random.randint(0, 10000)
-            randNumEject = numpy.random.randint(0, 10000)
+            randNumSplit = self.field.getRng().integers(0, 10000)
+            randNumEject = self.field.getRng().integers(0, 10000)
             if randNumSplit > self.splitLikelihood:
                 self.currentAction[2] = True
             if randNumEject > self.ejectLikelihood:
                 self.currentAction[3] = True
-        else:
-            self.currentAction[2] = False
-            self.currentAction[3] = False
 
     def isRelativeCellData(self, cell, left, top, size):
         return getRelativeCellPos(cell, left, top, size) + \
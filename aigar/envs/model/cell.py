@@ -2,11 +2,16 @@ import math
 
 import numpy
 
+from .cellStore import *
 from .parameters import *
 
 
 
 class Cell(object):
+    """ A thin view onto one row of a CellStore. All numerical properties of the cell live in the store, the view
+    only keeps the python objects that belong to the cell (player, name, color, ejecter cell).
+    A cell that is created without a store gets a private one and can later be adopted by the store of a field.
+    """
     _cellId = 0
 
     @property
@@ -20,43 +25,127 @@ class Cell(object):
     def __repr__(self):
         return self.name + " id: " + str(self.id) + " -M:" + str(int(self.mass)) + " Pos:" + str(int(self.x)) + "," + str(int(self.y))
 
-    def __init__(self, x, y, mass, player):
+    def __init__(self, x, y, mass, player, store=None, kind=None, color=None):
         self.player = player
-        self.mass = None
-        self.radius = None
-        self.setMass(mass)
-        self.x = x
-        self.y = y
-        self.pos = [x,y]
+        if kind is None:
+            kind = PELLET if player is None else PLAYER
+        if store is None:
+            store = CellStore(1)
+        self.store = None
+        self.storeIdx = None
+        owner = -1 if player is None or player.getId() is None else player.getId()
+        store.add(self, x, y, mass, kind, owner)
         if self.player is None:
             self.name = ""
-            self.color = (numpy.random.randint(50, 200), numpy.random.randint(50, 200), numpy.random.randint(50, 200))
+            if color is None:
+                rng = store.getRng()
+                if rng is None:
+                    rng = numpy.random.default_rng()
+                color = tuple(rng.integers(50, 200, 3).tolist())
+            self.color = color
             self.id = -1
         else:
             self.name = player.getName()
             self.color = self.player.getColor()
             self.id = self.cellId
             self.cellId += 1
-        self.velocity = [0, 0]
-        self.splitVelocity = [0, 0]
-        self.splitVelocityCounter = 0
-        self.splitVelocityCounterMax = 15
-        self.mergeTime = 0
+        self.splitVelocityCounterMax = SPLIT_VELOCITY_COUNTER_MAX
         self.blobToBeEjected = None
         self.ejecterCell = None # Used in case of blobs to determine which player ejected this blob
         self.alive = True
 
+    # Creates one player-less cell per position in the store at once. The views skip __init__, their rows are
+    # filled with one batched store call
+    @classmethod
+    def createMany(cls, store, positions, masses, kind, colors, name=""):
+        cells = [cls.__new__(cls) for _ in range(len(positions))]
+        store.addMany(cells, positions, masses, kind)
+        for cell, color in zip(cells, colors):
+            cell.player = None
+            cell.name = name
+            cell.color = color
+            cell.id = -1
+            cell.splitVelocityCounterMax = SPLIT_VELOCITY_COUNTER_MAX
+            cell.blobToBeEjected = None
+            cell.ejecterCell = None
+            cell.alive = True
+        return cells
+
+    # Views onto the store columns:
+    @property
+    def x(self):
+        return self.store.pos.item(self.storeIdx, 0)
+
+    @x.setter
+    def x(self, val):
+        self.store.pos[self.storeIdx, 0] = val
+
+    @property
+    def y(self):
+        return self.store.pos.item(self.storeIdx, 1)
+
+    @y.setter
+    def y(self, val):
+        self.store.pos[self.storeIdx, 1] = val
+
+    @property
+    def pos(self):
+        return self.store.pos[self.storeIdx].tolist()
+
+    @property
+    def mass(self):
+        return self.store.mass.item(self.storeIdx)
+
+    @mass.setter
+    def mass(self, val):
+        self.store.mass[self.storeIdx] = val
+
+    @property
+    def radius(self):
+        return self.store.radius.item(self.storeIdx)
+
+    @radius.setter
+    def radius(self, val):
+        self.store.radius[self.storeIdx] = val
+
+    @property
+    def velocity(self):
+        return self.store.velocity[self.storeIdx]
+
+    @velocity.setter
+    def velocity(self, val):
+        self.store.velocity[self.storeIdx] = val
+
+    @property
+    def splitVelocity(self):
+        return self.store.splitVelocity[self.storeIdx]
+
+    @splitVelocity.setter
+    def splitVelocity(self, val):
+        self.store.splitVelocity[self.storeIdx] = val
+
+    @property
+    def splitVelocityCounter(self):
+        return self.store.splitVelocityCounter.item(self.storeIdx)
+
+    @splitVelocityCounter.setter
+    def splitVelocityCounter(self, val):
+        self.store.splitVelocityCounter[self.storeIdx] = val
+
+    @property
+    def mergeTime(self):
+        return self.store.mergeTime.item(self.storeIdx)
+
+    @mergeTime.setter
+    def mergeTime(self, val):
+        self.store.mergeTime[self.storeIdx] = val
+
+    @property
+    def kind(self):
+        return self.store.kind.item(self.storeIdx)
+
     def setMoveDirection(self, commandPoint):
-        xDiff = commandPoint[0] - self.x
-        yDiff = commandPoint[1] - self.y
-        # If cursor is within cell, reduce speed based on distance from cell center (as a percentage)
-        hypotenuseSquared = xDiff * xDiff + yDiff * yDiff
-        radiusSquared = self.radius * self.radius
-        speedModifier = min(hypotenuseSquared, radiusSquared) / radiusSquared
-        # Check polar coordinate of cursor from cell center
-        angle = math.atan2(yDiff, xDiff)
-        self.velocity[0] =  self.getReducedSpeed() * speedModifier * math.cos(angle)
-        self.velocity[1] =  self.getReducedSpeed() * speedModifier * math.sin(angle)
+        self.store.setMoveDirection([self.storeIdx], commandPoint)
 
     @staticmethod
     def squareDist(pos1, pos2):
@@ -73,7 +162,7 @@ class Cell(object):
 
     def split(self, commandPoint, fieldWidth, fieldHeight):
         cellPos = self.getPos()
-        newCell = Cell(cellPos[0], cellPos[1], self.mass / 2, self.player)
+        newCell = Cell(cellPos[0], cellPos[1], self.mass / 2, self.player, self.store, self.kind)
         angle = newCell.calculateAngle(commandPoint)
 
         xPoint = math.cos(angle) * newCell.getRadius() * 4.5 + cellPos[0]
@@ -105,17 +194,7 @@ class Cell(object):
         self.splitVelocityCounter = self.splitVelocityCounterMax
 
     def updateMomentum(self):
-        if self.splitVelocityCounter == -1:
-            return
-        elif self.splitVelocityCounter > 0:
-            self.splitVelocityCounter -= 1
-            counterRatio = self.splitVelocityCounter / self.splitVelocityCounterMax
-            if counterRatio < 0.1:
-                self.splitVelocity[0] *= (1 - counterRatio)
-                self.splitVelocity[1] *= (1 - counterRatio)
-        else:
-            self.splitVelocity = [0,0]
-            self.splitVelocityCounter = -1
+        self.store.updateMomentum([self.storeIdx])
 
     # Increases the mass of the cell by value and updates the radius accordingly
     def grow(self, foodMass):
@@ -123,24 +202,13 @@ class Cell(object):
         self.setMass(newMass)
 
     def decayMass(self):
-        if self.mass >= 4:
-            newMass = self.mass * CELL_MASS_DECAY_RATE
-            self.setMass(newMass)
+        self.store.decayMass([self.storeIdx])
 
     def updateMerge(self):
-        if self.mergeTime > 0:
-            self.mergeTime -= 1
+        self.store.updateMerge([self.storeIdx])
 
     def updatePos(self, maxX, maxY):
-        xSpeed = self.velocity[0] + self.splitVelocity[0]
-        ySpeed = self.velocity[1] + self.splitVelocity[1]
-        self.x = self.updateDirection(self.x, xSpeed, maxX)
-        self.y = self.updateDirection(self.y, ySpeed, maxY)
-        self.pos = [self.x, self.y]
-        if self.splitVelocityCounter and self.x == maxX or self.x == 0:
-            self.splitVelocity[0] *= -1
-        if self.splitVelocityCounter and self.y == maxY or self.y == 0:
-            self.splitVelocity[1] *= -1
+        self.store.updatePos([self.storeIdx], maxX, maxY)
 
     def overlap(self, cell):
         if self.getMass() > cell.getMass():
@@ -158,8 +226,9 @@ class Cell(object):
 
     # Returns the squared distance from the self cell to another cell
     def squaredDistance(self, cell):
+        x, y = self.getPos()
         pos2 = cell.getPos()
-        return (self.x - pos2[0]) * (self.x - pos2[0]) + (self.y - pos2[1]) * (self.y - pos2[1])
+        return (x - pos2[0]) * (x - pos2[0]) + (y - pos2[1]) * (y - pos2[1])
 
     # Checks:
     def canEat(self, cell):
@@ -201,9 +270,7 @@ class Cell(object):
         self.alive = val
 
     def setPos(self, pos):
-        self.pos = pos
-        self.x = pos[0]
-        self.y = pos[1]
+        self.store.pos[self.storeIdx] = pos
 
     def setRadius(self, val):
         self.radius = val
@@ -234,22 +301,22 @@ class Cell(object):
         return self.name
 
     def getX(self):
-        return self.x
+        return self.store.pos.item(self.storeIdx, 0)
 
     def getY(self):
-        return self.y
+        return self.store.pos.item(self.storeIdx, 1)
 
     def getPos(self):
-        return self.pos
+        return self.store.pos[self.storeIdx].tolist()
 
     def getColor(self):
         return self.color
 
     def getRadius(self):
-        return self.radius
+        return self.store.radius.item(self.storeIdx)
 
     def getMass(self):
-        return self.mass
+        return self.store.mass.item(self.storeIdx)
 
     def getReducedSpeed(self):
         #return CELL_MOVE_SPEED * math.pow(self.mass, -0.439)
@@ -0,0 +1,406 @@
+import numpy
+
+from . import kernels
+from .parameters import *
+
+# Kinds of cells that live in a store:
+PELLET = 0
+BLOB = 1
+VIRUS = 2
+PLAYER = 3
+NUM_KINDS = 4
+
+COLUMNS = ("pos", "mass", "radius", "velocity", "splitVelocity", "splitVelocityCounter", "mergeTime", "owner", "kind")
+
+
+class CellStore(object):
+    """ Structure-of-arrays storage for the cells of a field.
+    Every property of a cell lives in a contiguous numpy column, such that the field and the players can update
+    all of their cells with a few array operations. Cell objects are thin views onto one row of the store.
+    Rows are kept dense: deleting a cell moves the last row into the freed slot (swap-remove).
+    """
+    def __repr__(self):
+        return "Cell store: " + str(self.count) + " cells, capacity " + str(self.capacity)
+
+    def __init__(self, capacity=64, rng=None):
+        # Random generator for the cells of the store, set by the field that owns the store
+        self.rng = rng
+        # If set, the batched updates run the loop kernels of the kernels module instead of numpy
+        self.useKernels = False
+        self.count = 0
+        self.capacity = 0
+        self.views = []
+        self.kindCounts = numpy.zeros(NUM_KINDS, dtype=numpy.int64)
+        self.pos = numpy.zeros((0, 2))
+        self.mass = numpy.zeros(0)
+        self.radius = numpy.zeros(0)
+        self.velocity = numpy.zeros((0, 2))
+        self.splitVelocity = numpy.zeros((0, 2))
+        self.splitVelocityCounter = numpy.zeros(0, dtype=numpy.int64)
+        self.mergeTime = numpy.zeros(0)
+        self.owner = numpy.zeros(0, dtype=numpy.int64)
+        self.kind = numpy.zeros(0, dtype=numpy.int8)
+        self.reserve(capacity)
+
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        for name in COLUMNS:
+            column = getattr(self, name)
+            newColumn = numpy.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            newColumn[:self.count] = column[:self.count]
+            setattr(self, name, newColumn)
+        self.capacity = capacity
+
+    def add(self, view, x, y, mass, kind, owner=-1):
+        if self.count == self.capacity:
+            self.reserve(max(1, 2 * self.capacity))
+        idx = self.count
+        self.count += 1
+        self.pos[idx] = (x, y)
+        self.mass[idx] = mass
+        self.radius[idx] = math.sqrt(mass / numpy.pi) if mass > 0 else 0
+        self.velocity[idx] = 0
+        self.splitVelocity[idx] = 0
+        self.splitVelocityCounter[idx] = 0
+        self.mergeTime[idx] = 0
+        self.owner[idx] = owner
+        self.kind[idx] = kind
+        self.kindCounts[kind] += 1
+        self.views.append(view)
+        view.store = self
+        view.storeIdx = idx
+        return idx
+
+    # Adds one row per view, all rows get the same kind and owner
+    def addMany(self, views, pos, masses, kind, owner=-1):
+        first = self.count
+        count = first + len(views)
+        if count > self.capacity:
+            self.reserve(max(count, 2 * self.capacity))
+        masses = numpy.asarray(masses, dtype=float)
+        self.pos[first:count] = pos
+        self.mass[first:count] = masses
+        self.radius[first:count] = numpy.sqrt(numpy.maximum(masses, 0) / numpy.pi)
+        self.velocity[first:count] = 0
+        self.splitVelocity[first:count] = 0
+        self.splitVelocityCounter[first:count] = 0
+        self.mergeTime[first:count] = 0
+        self.owner[first:count] = owner
+        self.kind[first:count] = kind
+        self.kindCounts[kind] += len(views)
+        self.views.extend(views)
+        for idx, view in enumerate(views, first):
+            view.store = self
+            view.storeIdx = idx
+        self.count = count
+
+    def copyRow(self, other, otherIdx, idx):
+        self.pos[idx] = other.pos[otherIdx]
+        self.mass[idx] = other.mass[otherIdx]
+        self.radius[idx] = other.radius[otherIdx]
+        self.velocity[idx] = other.velocity[otherIdx]
+        self.splitVelocity[idx] = other.splitVelocity[otherIdx]
+        self.splitVelocityCounter[idx] = other.splitVelocityCounter[otherIdx]
+        self.mergeTime[idx] = other.mergeTime[otherIdx]
+        self.owner[idx] = other.owner[otherIdx]
+
+    # Moves a cell that lives in another store (e.g. a cell that was created on its own) into this store
+    def adopt(self, view, kind):
+        if view.store is self:
+            self.setKind(view.storeIdx, kind)
+            return
+        other = view.store
+        otherIdx = view.storeIdx
+        self.add(view, 0, 0, 0, kind)
+        self.copyRow(other, otherIdx, view.storeIdx)
+        other.remove(otherIdx, detach=False)
+
+    # Removes a row by moving the last row into its place. The removed view keeps a private copy of its data,
+    # such that dead cells can still be inspected.
+    def remove(self, idx, detach=True):
+        if detach:
+            self.detachRows([idx])
+        self.kindCounts[self.kind[idx]] -= 1
+        last = self.count - 1
+        if idx != last:
+            self.copyRow(self, last, idx)
+            self.kind[idx] = self.kind[last]
+            movedView = self.views[last]
+            movedView.storeIdx = idx
+            self.views[idx] = movedView
+        self.views.pop()
+        self.count -= 1
+
+    # Removes several distinct rows at once. The rows at the end of the store that survive fill the freed slots.
+    def removeMany(self, idxs, detach=True):
+        idxs = numpy.sort(idxs)
+        if not len(idxs):
+            return
+        if detach:
+            self.detachRows(idxs)
+        self.kindCounts -= numpy.bincount(self.kind[idxs], minlength=NUM_KINDS)
+        newCount = self.count - len(idxs)
+        holes = idxs[idxs < newCount]
+        survivors = numpy.ones(len(idxs), dtype=bool)
+        survivors[idxs[idxs >= newCount] - newCount] = False
+        movers = numpy.arange(newCount, self.count)[survivors]
+        for name in COLUMNS:
+            column = getattr(self, name)
+            column[holes] = column[movers]
+        views = self.views
+        for hole, mover in zip(holes.tolist(), movers.tolist()):
+            movedView = views[mover]
+            movedView.storeIdx = hole
+            views[hole] = movedView
+        del views[newCount:]
+        self.count = newCount
+
+    # Gives the views of the given rows a private copy of their data
+    def detachRows(self, idxs):
+        detached = CellStore(len(idxs))
+        for name in COLUMNS:
+            getattr(detached, name)[:len(idxs)] = getattr(self, name)[idxs]
+        detached.count = len(idxs)
+        detached.kindCounts += numpy.bincount(detached.kind[:len(idxs)], minlength=NUM_KINDS)
+        detached.views = [self.views[idx] for idx in idxs]
+        for detachedIdx, view in enumerate(detached.views):
+            view.store = detached
+            view.storeIdx = detachedIdx
+
+    def removeCell(self, view):
+        if view.store is self:
+            self.remove(view.storeIdx)
+
+    # Returns a copy of the rows of the store. The views themselves are not copied, restore puts them back in place
+    def snapshot(self):
+        count = self.count
+        return count, self.kindCounts.copy(), list(self.views), [getattr(self, name)[:count].copy() for name in COLUMNS]
+
+    # Views that were removed since the snapshot are attached to the store again (and are alive again), views that
+    # were added since then should not be used anymore
+    def restore(self, snapshot):
+        count, kindCounts, views, columns = snapshot
+        self.reserve(count)
+        for name, column in zip(COLUMNS, columns):
+            getattr(self, name)[:count] = column
+        self.count = count
+        self.kindCounts[:] = kindCounts
+        self.views = list(views)
+        for idx, view in enumerate(self.views):
+            view.store = self
+            view.storeIdx = idx
+            view.alive = True
+
+    # Views of the cleared cells are not detached, they should not be used anymore after a clear
+    def clear(self):
+        self.count = 0
+        self.views = []
+        self.kindCounts[:] = 0
+
+    def setKind(self, idx, kind):
+        self.kindCounts[self.kind[idx]] -= 1
+        self.kindCounts[kind] += 1
+        self.kind[idx] = kind
+
+    def setMass(self, idxs, masses):
+        masses = numpy.asarray(masses, dtype=float)
+        self.mass[idxs] = masses
+        self.radius[idxs] = numpy.sqrt(numpy.maximum(masses, 0) / numpy.pi)
+
+    # Batched cell updates. All of them take an array of row indices and mirror the scalar methods of Cell.
+    def decayMass(self, idxs):
+        mass = self.mass[idxs]
+        decaying = mass >= 4
+        self.setMass(idxs, numpy.where(decaying, mass * CELL_MASS_DECAY_RATE, mass))
+
+    def updateMerge(self, idxs):
+        mergeTime = self.mergeTime[idxs]
+        self.mergeTime[idxs] = numpy.where(mergeTime > 0, mergeTime - 1, mergeTime)
+
+    def updateMomentum(self, idxs):
+        counter = self.splitVelocityCounter[idxs]
+        splitVelocity = self.splitVelocity[idxs]
+        moving = counter > 0
+        stopping = counter == 0
+        counter[moving] -= 1
+        counterRatio = counter / SPLIT_VELOCITY_COUNTER_MAX
+        damped = moving & (counterRatio < 0.1)
+        splitVelocity[damped] *= (1 - counterRatio[damped])[:, None]
+        splitVelocity[stopping] = 0
+        counter[stopping] = -1
+        self.splitVelocity[idxs] = splitVelocity
+        self.splitVelocityCounter[idxs] = counter
+
+    # decayMass, updateMomentum, updateMerge and setMoveDirection in one call, with one command point per row
+    def updateCellProperties(self, idxs, commandPoints):
+        if self.useKernels:
+            kernels.updateCellProperties(self.pos, self.mass, self.radius, self.velocity, self.splitVelocity,
+                                         self.splitVelocityCounter, self.mergeTime, idxs,
+                                         numpy.asarray(commandPoints, dtype=float))
+            return
+        self.decayMass(idxs)
+        self.updateMomentum(idxs)
+        self.updateMerge(idxs)
+        self.setMoveDirection(idxs, commandPoints)
+
+    # commandPoint is either one point for all rows or one point per row
+    def setMoveDirection(self, idxs, commandPoint):
+        pos = self.pos[idxs]
+        commandPoint = numpy.asarray(commandPoint, dtype=float)
+        xDiff = commandPoint[..., 0] - pos[:, 0]
+        yDiff = commandPoint[..., 1] - pos[:, 1]
+        # If cursor is within cell, reduce speed based on distance from cell center (as a percentage)
+        hypotenuseSquared = xDiff * xDiff + yDiff * yDiff
+        radius = self.radius[idxs]
+        radiusSquared = radius * radius
+        speedModifier = numpy.minimum(hypotenuseSquared, radiusSquared) / radiusSquared
+        angle = numpy.arctan2(yDiff, xDiff)
+        speed = CELL_MOVE_SPEED * numpy.power(self.mass[idxs], -0.35) * speedModifier
+        self.velocity[idxs, 0] = speed * numpy.cos(angle)
+        self.velocity[idxs, 1] = speed * numpy.sin(angle)
+
+    def updatePos(self, idxs, maxX, maxY):
+        if self.useKernels:
+            kernels.updatePos(self.pos, self.velocity, self.splitVelocity, self.splitVelocityCounter,
+                              numpy.asarray(idxs, dtype=numpy.int64), maxX, maxY)
+            return
+        limits = numpy.array([maxX, maxY])
+        pos = numpy.minimum(limits, numpy.maximum(0, self.pos[idxs] + (self.velocity[idxs] + self.splitVelocity[idxs])))
+        self.pos[idxs] = pos
+        moving = self.splitVelocityCounter[idxs] != 0
+        bounce = (moving[:, None] & (pos == limits)) | (pos == 0)
+        splitVelocity = self.splitVelocity[idxs]
+        splitVelocity[bounce] *= -1
+        self.splitVelocity[idxs] = splitVelocity
+
+    # Checks:
+    def overlap(self, idx, idxs):
+        mass = self.mass[idxs]
+        biggerRadius = numpy.where(self.mass[idx] > mass, self.radius[idx], self.radius[idxs])
+        diff = self.pos[idxs] - self.pos[idx]
+        squaredDistance = diff[:, 0] * diff[:, 0] + diff[:, 1] * diff[:, 1]
+        return squaredDistance * 1.1 < biggerRadius * biggerRadius
+
+    # Sort-and-sweep broad phase: returns the pairs of the given rows whose bounding boxes overlap, as positions
+    # (first, second) into idxs with first < second, ordered by first and then by second. The rows are sorted by the
+    # left edge of their box once, every row is paired with the rows whose left edge lies within its x-interval and
+    # the pairs are then tested for overlapping y-intervals.
+    def getOverlappingBoxPairs(self, idxs):
+        x = self.pos[idxs, 0]
+        y = self.pos[idxs, 1]
+        radius = self.radius[idxs]
+        left = x - radius
+        order = numpy.argsort(left, kind="stable")
+        if self.useKernels:
+            first, second = kernels.sweepBoxPairs(order, left, x + radius, y, radius)
+        else:
+            sortedLeft = left[order]
+            counts = numpy.searchsorted(sortedLeft, (x + radius)[order], "right") - numpy.arange(len(idxs)) - 1
+            sweepNrs = numpy.repeat(numpy.arange(len(idxs)), counts)
+            partnerNrs = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts) + \
+                sweepNrs + 1
+            first = order[sweepNrs]
+            second = order[partnerNrs]
+            keep = numpy.abs(y[first] - y[second]) <= radius[first] + radius[second]
+            first, second = numpy.minimum(first[keep], second[keep]), numpy.maximum(first[keep], second[keep])
+        pairOrder = numpy.lexsort((second, first))
+        return first[pairOrder], second[pairOrder]
+
+    # Pushes the cells of the pairs (first, second) apart until they just touch, the smaller cell of a pair moves by
+    # the larger share. Pairs in which a cell was just ejected or in which both cells can merge are skipped. All
+    # pairs are resolved simultaneously: the displacements are computed from the current positions and summed per
+    # cell, then the cells are clamped to the field.
+    def pushApart(self, first, second, maxX, maxY):
+        if self.useKernels:
+            kernels.pushApart(self.pos, self.mass, self.radius, self.splitVelocityCounter, self.mergeTime, first,
+                              second, maxX, maxY)
+            return
+        diff = self.pos[first] - self.pos[second]
+        distance = numpy.sqrt(diff[:, 0] * diff[:, 0] + diff[:, 1] * diff[:, 1])
+        summedRadii = self.radius[first] + self.radius[second]
+        counter = self.splitVelocityCounter
+        mergeTime = self.mergeTime
+        pushed = (distance < summedRadii) & (distance != 0) & (counter[first] <= 0) & (counter[second] <= 0) & \
+                 ~((mergeTime[first] <= 0) & (mergeTime[second] <= 0))
+        if not pushed.any():
+            return
+        first, second, diff, distance = first[pushed], second[pushed], diff[pushed], distance[pushed]
+        firstMass = self.mass[first]
+        secondMass = self.mass[second]
+        firstBigger = firstMass > secondMass
+        # Share of the bigger cell, the smaller one moves by the rest
+        massRatio = numpy.where(firstBigger, secondMass / firstMass, firstMass / secondMass)
+        push = diff * ((summedRadii[pushed] - distance) / distance)[:, None]
+        firstShare = numpy.where(firstBigger, massRatio, 1 - massRatio)[:, None]
+        # The displacements are only accumulated for the moved rows, not for the whole store
+        moved, movedNrs = numpy.unique(numpy.concatenate((first, second)), return_inverse=True)
+        displacement = numpy.zeros((len(moved), 2))
+        numpy.add.at(displacement, movedNrs[:len(first)], push * firstShare)
+        numpy.add.at(displacement, movedNrs[len(first):], -push * (1 - firstShare))
+        limits = numpy.array([maxX, maxY])
+        self.pos[moved] = numpy.minimum(limits, numpy.maximum(0, self.pos[moved] + displacement))
+
+    # Returns which of the pairs (cellIdxs[pairCells], pairPellets) overlap such that the cell can eat the pellet. A
+    # pellet that the cell can eat is always smaller, so the cell's radius decides the overlap
+    def findEdiblePairs(self, cellIdxs, pairCells, pairPellets):
+        if self.useKernels:
+            return kernels.findEdiblePairs(self.pos, self.mass, self.radius, cellIdxs, pairCells, pairPellets)
+        pairCellIdxs = cellIdxs[pairCells]
+        diff = self.pos[pairPellets] - self.pos[pairCellIdxs]
+        radius = self.radius[pairCellIdxs]
+        edible = (diff[:, 0] * diff[:, 0] + diff[:, 1] * diff[:, 1]) * 1.1 < radius * radius
+        edible &= self.mass[pairCellIdxs] > 1.25 * self.mass[pairPellets]
+        return edible
+
+    def isInFov(self, idxs, fovPos, fovSize):
+        halvedFovDims = fovSize / 2
+        x = self.pos[idxs, 0]
+        y = self.pos[idxs, 1]
+        radius = self.radius[idxs]
+        outside = (x + radius < fovPos[0] - halvedFovDims) | (x - radius > fovPos[0] + halvedFovDims) | \
+                  (y + radius < fovPos[1] - halvedFovDims) | (y - radius > fovPos[1] + halvedFovDims)
+        return ~outside
+
+    def canEat(self, idx, idxs):
+        return self.mass[idx] > 1.25 * self.mass[idxs]
+
+    # Returns the cells of candidates that overlap with cell (and that cell can eat, if edible is set)
+    def getOverlapping(self, cell, candidates, edible=False):
+        if not candidates:
+            return []
+        candidates = list(candidates)
+        idxs = numpy.array([candidate.storeIdx for candidate in candidates])
+        mask = self.overlap(cell.storeIdx, idxs)
+        if edible:
+            mask &= self.canEat(cell.storeIdx, idxs)
+        return [candidates[i] for i in numpy.flatnonzero(mask)]
+
+    # Returns the cells that are at least partially within the given field of view
+    def getCellsInFov(self, cells, fovPos, fovSize):
+        if not cells:
+            return []
+        cells = list(cells)
+        idxs = numpy.array([cell.storeIdx for cell in cells])
+        return [cells[i] for i in numpy.flatnonzero(self.isInFov(idxs, fovPos, fovSize))]
+
+    # Setters:
+    def setRng(self, rng):
+        self.rng = rng
+
+    # Getters:
+    def getRng(self):
+        return self.rng
+
+    def getCount(self):
+        return self.count
+
+    def getCountOfKind(self, kind):
+        return self.kindCounts[kind]
+
+    def getIdxsOfKind(self, kind):
+        return numpy.flatnonzero(self.kind[:self.count] == kind)
+
+    def getViewsOfKind(self, kind):
+        views = self.views
+        return [views[idx] for idx in self.getIdxsOfKind(kind)]
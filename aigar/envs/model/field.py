@@ -1,26 +1,32 @@
-import os
 import time
 
 import numpy
 
 from .cell import Cell
+from .cellStore import *
+from .fieldStats import FieldStats, UPDATE_PHASES
+from .kernels import resolveKernelBackend
 from .parameters import *
-from .spatialHashTable import SpatialHashTable
+from .spatialHashTable import SpatialHashTable, FlatSpatialHashTable
+
+# Selectable spatial hash table engines for the field
+HASH_TABLE_BACKENDS = {"dict": SpatialHashTable,
+                       "flat": FlatSpatialHashTable}
+
+# Store rows (first, second) of the overlapping cell pairs of a player, when there are none
+NO_CELL_PAIRS = (numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64))
 
 
 def adjustCellSize(cell, mass, hashtable):
-    hashtable.deleteObject(cell)
     cell.grow(mass)
-    hashtable.insertObject(cell)
+    hashtable.updateObject(cell)
 
 
-def randomSize():
+def randomSizes(rng, count):
     maxRand = 50
     maxPelletSize = 4
-    sizeRand = numpy.random.randint(0, maxRand)
-    if sizeRand > (maxRand - maxPelletSize):
-        return maxRand - sizeRand
-    return 1
+    sizeRand = rng.integers(0, maxRand, count)
+    return numpy.where(sizeRand > (maxRand - maxPelletSize), maxRand - sizeRand, 1)
 
 
 class Field(object):
@@ -28,117 +34,249 @@ class Field(object):
     Its size depends on how many players are in the game
     It always contains a certain number of viruses and collectibles and regulates their number and spawnings
     """
-    def __init__(self, virusEnabled):
-        # Set numpy seed to process ID * current time, otherwise all subprocesses have same outcome
-        numpy.random.seed(int(time.time())%os.getpid())
+    def __init__(self, virusEnabled, seed=None):
+        # Every field draws from its own random generator, such that fields in the same process do not interfere.
+        # Without a seed the generator is seeded from the OS.
+        self.rng = numpy.random.default_rng(seed)
         self.size = 0
-        self.pellets = []
+        # All pellets, blobs, viruses and player cells live in one structure-of-arrays store.
+        # Ejected particles (blobs) become pellets once momentum is lost
+        self.cellStore = CellStore(rng=self.rng)
         self.players = []
-        self.blobs = [] # Ejected particles become pellets once momentum is lost
         self.deadPlayers = []
-        self.viruses = []
         self.maxCollectibleCount = None
         self.maxVirusCount = None
         self.pelletHashTable = None
         self.blobHashTable = None
         self.playerHashTable = None
         self.virusHashTable = None
+        self.hashTableClass = SpatialHashTable
+        # Cells of the field right after a reset, cached by resetToInitialState
+        self.initialState = None
+        # Timers and counters of the update phases, only collected if enabled
+        self.stats = None
+        # Candidate partners of every player cell from the broad phase of the current tick, split into the cells of
+        # the same player and the cells of other players
+        self.mergeCellPartners = {}
+        self.enemyCellPartners = {}
+        self.playerCellPairs = NO_CELL_PAIRS
 
         self.virusEnabled = virusEnabled
 
 
+    # Replaces the random generator of the field. Takes anything that numpy.random.default_rng accepts.
+    def seed(self, seed=None):
+        self.rng = numpy.random.default_rng(seed)
+        self.cellStore.setRng(self.rng)
+
     def initializePlayer(self, player):
-        player.randomizeColor()
+        player.randomizeColor(self.rng)
         player.cells = []
         x, y = self.getSpawnPos(START_RADIUS)
-        newCell = Cell(x, y, START_MASS, player)
+        newCell = Cell(x, y, START_MASS, player, self.cellStore)
         player.addCell(newCell)
         player.setAlive()
 
-    def initialize(self):
-        self.size = int(SIZE_INCREASE_PER_PLAYER * math.sqrt(len(self.players)))
-        self.pelletHashTable = SpatialHashTable(self.size, HASH_BUCKET_SIZE)
-        self.blobHashTable = SpatialHashTable(self.size, HASH_BUCKET_SIZE)
-        self.playerHashTable = SpatialHashTable(self.size, HASH_BUCKET_SIZE)
-        self.virusHashTable = SpatialHashTable(self.size, HASH_BUCKET_SIZE)
+    def initialize(self, hashTableBackend=HASH_TABLE_BACKEND, fieldScale=FIELD_SCALE, kernelBackend=KERNEL_BACKEND):
+        if hashTableBackend not in HASH_TABLE_BACKENDS:
+            raise ValueError("Unknown hash table backend " + str(hashTableBackend) + ", choose one of " +
+                             str(list(HASH_TABLE_BACKENDS)))
+        if fieldScale <= 0:
+            raise ValueError("The field scale has to be positive!")
+        self.cellStore.useKernels = resolveKernelBackend(kernelBackend) == "numba"
+        self.hashTableClass = HASH_TABLE_BACKENDS[hashTableBackend]
+        self.size = int(SIZE_INCREASE_PER_PLAYER * math.sqrt(len(self.players)) * fieldScale)
+        self.initialState = None
+        self.createHashTables()
         for player in self.players:
             self.initializePlayer(player)
         self.maxCollectibleCount = self.size * self.size * MAX_COLLECTIBLE_DENSITY
         self.maxVirusCount = self.size * self.size * MAX_VIRUS_DENSITY
-        self.spawnStuff()
+        self.spawnStuff(countRespawns=False)
 
+    # The store and the hash tables are cleared and reused instead of being allocated again
     def reset(self):
         # Clear field
-        self.pellets = []
-        self.blobs = []  # Ejected particles become pellets once momentum is lost
-        self.deadPlayers = []
-        self.viruses = []
-        self.pelletHashTable = SpatialHashTable(self.size, HASH_BUCKET_SIZE)
-        self.blobHashTable = SpatialHashTable(self.size, HASH_BUCKET_SIZE)
-        self.playerHashTable = SpatialHashTable(self.size, HASH_BUCKET_SIZE)
-        self.virusHashTable = SpatialHashTable(self.size, HASH_BUCKET_SIZE)
+        self.clear()
 
         # Spawn stuff
         for player in self.players:
             self.initializePlayer(player)
-        self.spawnStuff()
+        self.spawnStuff(countRespawns=False)
+
+    # Resets the field to the state after the first reset with this method: players and viruses start where they
+    # started back then, only the positions of the pellets are drawn anew (in one vectorized call)
+    def resetToInitialState(self):
+        if self.initialState is None:
+            self.reset()
+            self.cacheInitialState()
+            return
+        playerStates, virusState, pelletState = self.initialState
+        self.clear()
+        for player, color, cellStates in playerStates:
+            player.color = color
+            player.cells = []
+            for x, y, mass in cellStates:
+                player.addCell(Cell(x, y, mass, player, self.cellStore))
+            player.setAlive()
+        virusPos, virusMasses, virusColors = virusState
+        Cell.createMany(self.cellStore, virusPos, virusMasses, VIRUS, virusColors, "Virus")
+        pelletMasses, pelletColors = pelletState
+        positions = self.rng.integers(0, self.size, (len(pelletMasses), 2))
+        pellets = Cell.createMany(self.cellStore, positions, pelletMasses, PELLET, pelletColors, "Pellet")
+        self.pelletHashTable.insertAllObjects(pellets)
+
+    def cacheInitialState(self):
+        store = self.cellStore
+        playerStates = [(player, player.getColor(), [(cell.getX(), cell.getY(), cell.getMass())
+                                                     for cell in player.getCells()])
+                        for player in self.players]
+        virusIdxs = store.getIdxsOfKind(VIRUS)
+        virusState = (store.pos[virusIdxs], store.mass[virusIdxs], [store.views[idx].getColor() for idx in virusIdxs])
+        pelletIdxs = store.getIdxsOfKind(PELLET)
+        pelletState = (store.mass[pelletIdxs], [store.views[idx].getColor() for idx in pelletIdxs])
+        self.initialState = (playerStates, virusState, pelletState)
+
+    def clear(self):
+        self.cellStore.clear()
+        self.deadPlayers = []
+        self.mergeCellPartners = {}
+        self.enemyCellPartners = {}
+        self.playerCellPairs = NO_CELL_PAIRS
+        for hashTable in self.getHashTables():
+            hashTable.clearBuckets()
+
+    # Captures the complete state of the field: the rows of the cell store, the players, the hash tables and the
+    # random generator. Restoring it puts the same cell and player objects back in place, such that the field
+    # continues exactly like it did after the snapshot was taken. A snapshot can be restored any number of times.
+    def snapshot(self):
+        return (self.cellStore.snapshot(), [player.snapshot() for player in self.players], list(self.deadPlayers),
+                [hashTable.snapshot() for hashTable in self.getHashTables()], self.rng.bit_generator.state)
+
+    def restore(self, snapshot):
+        storeSnapshot, playerSnapshots, deadPlayers, hashTableSnapshots, rngState = snapshot
+        self.cellStore.restore(storeSnapshot)
+        for player, playerSnapshot in zip(self.players, playerSnapshots):
+            player.restore(playerSnapshot)
+        self.deadPlayers = list(deadPlayers)
+        for hashTable, hashTableSnapshot in zip(self.getHashTables(), hashTableSnapshots):
+            hashTable.restore(hashTableSnapshot)
+        self.rng.bit_generator.state = rngState
+
+    def createHashTables(self):
+        self.pelletHashTable = self.hashTableClass(self.size, HASH_BUCKET_SIZE)
+        self.blobHashTable = self.hashTableClass(self.size, HASH_BUCKET_SIZE)
+        self.playerHashTable = self.hashTableClass(self.size, HASH_BUCKET_SIZE)
+        self.virusHashTable = self.hashTableClass(self.size, HASH_BUCKET_SIZE)
 
     def update(self):
-        self.updateViruses()
-        self.updateBlobs()
-        self.updatePlayers()
-        self.updateHashTables()
-        self.mergePlayerCells()
-        self.checkOverlaps()
-        self.spawnStuff()
-        
+        if self.stats is None:
+            for phase in UPDATE_PHASES:
+                getattr(self, phase)()
+            return
+        self.stats.startUpdate()
+        for phase in UPDATE_PHASES:
+            start = time.perf_counter()
+            getattr(self, phase)()
+            self.stats.addTime(phase, time.perf_counter() - start)
+        self.stats.recordBucketSizes(self.getHashTables())
+
+    def enableStats(self, enabled=True):
+        self.stats = FieldStats() if enabled else None
+
+    def countStat(self, name, value=1):
+        if self.stats is not None:
+            self.stats.count(name, value)
 
     def updateViruses(self):
-        for virus in self.viruses:
-            virus.updateMomentum()
-            virus.updatePos(self.size, self.size)
+        virusIdxs = self.cellStore.getIdxsOfKind(VIRUS)
+        if not len(virusIdxs):
+            return
+        self.cellStore.updateMomentum(virusIdxs)
+        self.cellStore.updatePos(virusIdxs, self.size, self.size)
 
     def updateBlobs(self):
-        notMovingBlobs = []
-        for blob in self.blobs:
-            if blob.getSplitVelocityCounter() == 0:
-                notMovingBlobs.append(blob)
-                continue
-            blob.updateMomentum()
-            blob.updatePos(self.size, self.size)
-        for blob in notMovingBlobs:
-            self.blobs.remove(blob)
+        blobIdxs = self.cellStore.getIdxsOfKind(BLOB)
+        if not len(blobIdxs):
+            return
+        notMoving = self.cellStore.splitVelocityCounter[blobIdxs] == 0
+        movingIdxs = blobIdxs[~notMoving]
+        self.cellStore.updateMomentum(movingIdxs)
+        self.cellStore.updatePos(movingIdxs, self.size, self.size)
+        for blobIdx in blobIdxs[notMoving]:
+            blob = self.cellStore.views[blobIdx]
             self.blobHashTable.deleteObject(blob)
             self.addPellet(blob)
 
+    # The kinematics of the cells of all living players are updated with batched store calls: decay, momentum, merge
+    # timer and move direction, then splitting and ejecting, then the movement (which includes the new cells)
     def updatePlayers(self):
+        alivePlayers = []
         for player in self.players:
             if player.getIsAlive():
-                player.update(self.size, self.size)
-                self.performEjections(player)
-                self.handlePlayerCollisions(player)
+                alivePlayers.append(player)
             else:
                 player.updateRespawnTime()
-
+        if alivePlayers:
+            cellIdxs, commandPoints = self.getPlayerCellIdxs(alivePlayers)
+            self.cellStore.updateCellProperties(cellIdxs, commandPoints)
+            for player in alivePlayers:
+                player.split(self.size, self.size)
+                player.eject()
+            cellIdxs, _ = self.getPlayerCellIdxs(alivePlayers)
+            self.cellStore.updatePos(cellIdxs, self.size, self.size)
+            for player in alivePlayers:
+                self.performEjections(player)
+        self.findPlayerCellPairs()
+        self.handlePlayerCollisions()
+
+    # Returns the store rows of the cells of the given players and the command point of the player of every row
+    def getPlayerCellIdxs(self, players):
+        cellIdxs = numpy.array([cell.storeIdx for player in players for cell in player.getCells()], dtype=numpy.int64)
+        cellCounts = [len(player.getCells()) for player in players]
+        commandPoints = numpy.repeat(numpy.array([player.getCommandPoint() for player in players], dtype=float),
+                                     cellCounts, axis=0)
+        return cellIdxs, commandPoints
+
+    # Sort-and-sweep broad phase over all player cells, once per tick after the players moved. The push-apart, the
+    # merging and the eating of player cells only test the pairs found here. The push-apart takes the same-player
+    # pairs as store rows, python partner lists (ordered like the cells of the players) are only built for the pairs
+    # of cells that can both merge and for the pairs of enemy cells. Cells that only come into contact later in the
+    # tick (by being pushed, by growing or by being created by a virus) are tested in the next tick.
+    def findPlayerCellPairs(self):
+        self.mergeCellPartners = {}
+        self.enemyCellPartners = {}
+        self.playerCellPairs = NO_CELL_PAIRS
+        cells = [cell for player in self.players if player.getIsAlive() for cell in player.getCells()]
+        if len(cells) < 2:
+            return
+        store = self.cellStore
+        storeIdxs = numpy.array([cell.storeIdx for cell in cells], dtype=numpy.int64)
+        first, second = store.getOverlappingBoxPairs(storeIdxs)
+        self.countStat("cellPairs", len(first))
+        firstIdxs = storeIdxs[first]
+        secondIdxs = storeIdxs[second]
+        samePlayer = store.owner[firstIdxs] == store.owner[secondIdxs]
+        self.playerCellPairs = (firstIdxs[samePlayer], secondIdxs[samePlayer])
+        canMerge = samePlayer & (store.mergeTime[firstIdxs] <= 0) & (store.mergeTime[secondIdxs] <= 0)
+        for partners, used in ((self.mergeCellPartners, canMerge), (self.enemyCellPartners, ~samePlayer)):
+            for firstNr, secondNr in zip(first[used].tolist(), second[used].tolist()):
+                partners.setdefault(cells[firstNr], []).append(cells[secondNr])
+                partners.setdefault(cells[secondNr], []).append(cells[firstNr])
+
+    # Moving objects are re-bucketed incrementally: only objects whose covered bucket range changed are moved
     def updateHashTables(self):
-        self.playerHashTable.clearBuckets()
-        for player in self.players:
-            if player.getIsAlive():
-                playerCells = player.getCells()
-                self.playerHashTable.insertAllObjects(playerCells)
-
-        self.blobHashTable.clearBuckets()
-        self.blobHashTable.insertAllObjects(self.blobs)
-
-        self.virusHashTable.clearBuckets()
-        self.virusHashTable.insertAllObjects(self.viruses)
+        playerCells = [cell for player in self.players if player.getIsAlive() for cell in player.getCells()]
+        self.playerHashTable.updateAllObjects(playerCells)
+        self.blobHashTable.updateAllObjects(self.getBlobs())
+        self.virusHashTable.updateAllObjects(self.getViruses())
 
     def performEjections(self, player):
         for cell in player.getCells():
             if cell.getBlobToBeEjected():
                 blobSpawnPos = cell.eject()
                 # Blobs are given a player such that cells of player who eject them don't instantly reabsorb them
-                blob = Cell(blobSpawnPos[0], blobSpawnPos[1], EJECTEDBLOB_BASE_MASS * 0.8, None)
+                blob = Cell(blobSpawnPos[0], blobSpawnPos[1], EJECTEDBLOB_BASE_MASS * 0.8, None, self.cellStore, BLOB)
 
                 blob.setColor(player.getColor())
                 #blob.setEjecterPlayer(player)
@@ -148,39 +286,12 @@ class Field(object):
                 blob.setEjecterCell(cell)
 
 
-    def handlePlayerCollisions(self, player):
-        for cell in player.getCells():
-            if cell.justEjected():
-                continue
-            for otherCell in player.getCells():
-                if cell is otherCell or otherCell.justEjected() or (cell.canMerge() and otherCell.canMerge()):
-                    continue
-                distance = numpy.sqrt(cell.squaredDistance(otherCell))
-                summedRadii = cell.getRadius() + otherCell.getRadius()
-                if distance < summedRadii and distance != 0:
-                    self.adjustCellPositions(cell, otherCell, distance, summedRadii)
-
-    def adjustCellPositions(self, cell1, cell2, distance, summedRadii):
-        if cell1.getMass() > cell2.getMass():
-            biggerCell = cell1
-            smallerCell = cell2
-        else:
-            biggerCell = cell2
-            smallerCell = cell1
-        bigPos = biggerCell.getPos()
-        smallPos = smallerCell.getPos()
-        distanceScaling = (summedRadii - distance) / distance
-        massDifferenceScaling = smallerCell.getMass() /  biggerCell.getMass()
-        xDiffScaled = (bigPos[0] - smallPos[0]) * distanceScaling
-        yDiffScaled = (bigPos[1] - smallPos[1]) * distanceScaling
-        newXBigCell = bigPos[0] + xDiffScaled * massDifferenceScaling
-        newYBigCell = bigPos[1] + yDiffScaled * massDifferenceScaling
-        newXSmallCell = smallPos[0] - xDiffScaled * (1 - massDifferenceScaling)
-        newYSmallCell = smallPos[1] - yDiffScaled * (1 - massDifferenceScaling)
-        newPosBig = [newXBigCell, newYBigCell]
-        newPosSmall = [newXSmallCell, newYSmallCell]
-        self.adjustCellPos(biggerCell, newPosBig)
-        self.adjustCellPos(smallerCell, newPosSmall)
+    # Pushes overlapping cells of the same player apart, unless one of them was just ejected or both can merge. All
+    # pairs found by the broad phase are resolved at once from the positions before the push.
+    def handlePlayerCollisions(self):
+        first, second = self.playerCellPairs
+        if len(first):
+            self.cellStore.pushApart(first, second, self.size, self.size)
 
     def mergePlayerCells(self):
         for player in self.players:
@@ -188,11 +299,13 @@ class Field(object):
                 cells = player.getMergableCells()
                 if len(cells) > 1:
                     cells.sort(key = lambda p: p.getMass(), reverse = True)
+                    ranks = {cell: rank for rank, cell in enumerate(cells)}
                     for cell1 in cells:
                         if not cell1.isAlive():
                             continue
-                        for cell2 in cells:
-                            if (not cell2.isAlive()) or (cell2 is cell1):
+                        partners = [cell for cell in self.mergeCellPartners.get(cell1, ()) if cell in ranks]
+                        for cell2 in sorted(partners, key=ranks.get):
+                            if not cell2.isAlive():
                                 continue
                             if cell1.overlap(cell2):
                                 self.mergeCells(cell1, cell2)
@@ -206,21 +319,68 @@ class Field(object):
         self.playerBlobOverlap()
         self.playerPlayerOverlap()
 
+    # Pellets are eaten in batched passes: every player cell gathers the pellets in the buckets it covers from the
+    # pellet hash table, such that the cost grows with the number of cells and not with the size of the field. The
+    # candidate (cell, pellet) pairs of all cells are tested with one vectorized distance check. A pellet that several
+    # cells could eat goes to the first of them. As a cell grows with every pellet it eats, the remaining candidates of
+    # the cells that grew are tested again with their new size until no cell eats anymore. Eaten pellets are removed
+    # from the store with one swap-remove pass.
     def playerPelletOverlap(self):
-        for player in self.players:
-            if player.getIsAlive():
-                for cell in player.getCells():
-                    for pellet in self.pelletHashTable.getNearbyObjects(cell):
-                        if cell.overlap(pellet) and cell.canEat(pellet):
-                            self.eatPellet(cell, pellet)
+        store = self.cellStore
+        cells = [cell for player in self.players if player.getIsAlive() for cell in player.getCells()]
+        if not store.getCountOfKind(PELLET) or not cells:
+            return
+        cellIdxs = numpy.array([cell.storeIdx for cell in cells], dtype=numpy.int64)
+        cellPos = store.pos[cellIdxs]
+        cellRadius = store.radius[cellIdxs]
+        candidates = [self.pelletHashTable.getNearbyIdxsInArea(pos, radius)
+                      for pos, radius in zip(cellPos.tolist(), cellRadius.tolist())]
+        counts = [len(pelletIdxs) for pelletIdxs in candidates]
+        numPairs = sum(counts)
+        self.countStat("cellsTested", numPairs)
+        if not numPairs:
+            return
+        pairCells = numpy.repeat(numpy.arange(len(cells)), counts)
+        pairPellets = numpy.concatenate(candidates)
+        eaten = []
+        while len(pairPellets):
+            edible = store.findEdiblePairs(cellIdxs, pairCells, pairPellets)
+            if not edible.any():
+                break
+            # The pairs are ordered by cell, so the first pair of a pellet belongs to the first cell that can eat it
+            eatenIdxs, firstPairs = numpy.unique(pairPellets[edible], return_index=True)
+            eatingCell = pairCells[edible][firstPairs]
+            # The masses are summed up in the order of the pellets' x coordinates, independent of the bucket layout
+            order = numpy.lexsort((eatenIdxs, store.pos[eatenIdxs, 0]))
+            eatenIdxs = eatenIdxs[order]
+            eatingCell = eatingCell[order]
+            self.countStat("overlapsFound", len(eatenIdxs))
+            eatenMass = numpy.bincount(eatingCell, weights=store.mass[eatenIdxs], minlength=len(cells))
+            grownCells = numpy.flatnonzero(eatenMass)
+            for cellNr in grownCells:
+                adjustCellSize(cells[cellNr], eatenMass[cellNr], self.playerHashTable)
+            eaten.append(eatenIdxs)
+            retested = numpy.isin(pairCells, grownCells) & ~numpy.isin(pairPellets, eatenIdxs)
+            pairCells = pairCells[retested]
+            pairPellets = pairPellets[retested]
+        if not eaten:
+            return
+        eatenIdxs = numpy.concatenate(eaten)
+        for pelletIdx in eatenIdxs:
+            pellet = store.views[pelletIdx]
+            self.pelletHashTable.deleteObject(pellet)
+            pellet.setAlive(False)
+        store.removeMany(eatenIdxs)
 
     def playerBlobOverlap(self):
         for player in self.players:
             if player.getIsAlive():
                 for cell in player.getCells():
-                    for blob in self.blobHashTable.getNearbyObjects(cell):
+                    nearbyBlobs = self.blobHashTable.getNearbyObjects(cell)
+                    self.countStat("cellsTested", len(nearbyBlobs))
+                    for blob in self.cellStore.getOverlapping(cell, nearbyBlobs, edible=True):
                         # If the ejecter player's cell is not the one overlapping with blob
-                        if cell.overlap(blob) and blob.getEjecterCell() is not cell and cell.canEat(blob):
+                        if blob.getEjecterCell() is not cell:
                             self.eatBlob(cell, blob)
 
 
@@ -228,16 +388,21 @@ class Field(object):
         for player in self.players:
             if player.getIsAlive():
                 for cell in player.getCells():
-                    for virus in self.virusHashTable.getNearbyObjects(cell):
-                        if cell.overlap(virus) and cell.getMass() > 1.25 * virus.getMass():
-                            self.eatVirus(cell, virus)
+                    nearbyViruses = self.virusHashTable.getNearbyObjects(cell)
+                    self.countStat("cellsTested", len(nearbyViruses))
+                    for virus in self.cellStore.getOverlapping(cell, nearbyViruses, edible=True):
+                        self.eatVirus(cell, virus)
 
     def playerPlayerOverlap(self):
         for player in self.players:
             if player.getIsAlive():
                 for playerCell in player.getCells():
-                    opponentCells = self.playerHashTable.getNearbyEnemyObjects(playerCell)                
+                    opponentCells = self.enemyCellPartners.get(playerCell, ())
+                    self.countStat("cellsTested", len(opponentCells))
                     for opponentCell in opponentCells:
+                            # The partners were found at the start of the tick, some of them may have been eaten since
+                            if not opponentCell.isAlive():
+                                continue
                             if playerCell.overlap(opponentCell):
                                 if playerCell.canEat(opponentCell):
                                     self.eatPlayerCell(playerCell, opponentCell)
@@ -248,30 +413,32 @@ class Field(object):
     def virusBlobOverlap(self):
         # After 7 feedings the virus splits in roughly the opposite direction of the last incoming ejectable
         # The ejected viruses bounce off of the edge of the fields
-        for virus in self.viruses:
+        for virus in self.getViruses():
             nearbyBlobs = self.blobHashTable.getNearbyObjects(virus)
+            self.countStat("cellsTested", len(nearbyBlobs))
             for blob in nearbyBlobs:
                 if virus.overlap(blob):
                     self.virusEatBlob(virus, blob)
 
 
-    def spawnStuff(self):
-        self.spawnPellets()
+    # Only the pellets spawned during an update are counted as respawned, not the ones of a new or reset field
+    def spawnStuff(self, countRespawns=True):
+        self.spawnPellets(countRespawns)
         if self.virusEnabled:
             self.spawnViruses()
         self.spawnPlayers()
 
     def spawnViruses(self):
-        while len(self.viruses) < self.maxVirusCount:
+        while self.cellStore.getCountOfKind(VIRUS) < self.maxVirusCount:
             self.spawnVirus()
 
     def spawnVirus(self):
         xPos, yPos = self.getSpawnPos(VIRUS_BASE_RADIUS)
         acceptableSpawnRange = HASH_BUCKET_SIZE - VIRUS_BASE_RADIUS
-        xPos += numpy.random.randint((-1)*acceptableSpawnRange/2, acceptableSpawnRange/2)
-        yPos += numpy.random.randint((-1)*acceptableSpawnRange/2, acceptableSpawnRange/2)
+        xPos += self.rng.integers((-1)*acceptableSpawnRange/2, acceptableSpawnRange/2)
+        yPos += self.rng.integers((-1)*acceptableSpawnRange/2, acceptableSpawnRange/2)
         size = VIRUS_BASE_SIZE
-        virus = Cell(xPos, yPos, size, None)
+        virus = Cell(xPos, yPos, size, None, self.cellStore, VIRUS)
         virus.setName("Virus")
         virus.setColor((0,255,0))
         self.addVirus(virus)
@@ -285,38 +452,40 @@ class Field(object):
     def getSpawnPos(self, radius):
         cols = self.playerHashTable.getCols()
         totalBuckets = self.playerHashTable.getRows() * cols
-        spawnBucket = numpy.random.randint(0, totalBuckets)
+        spawnBucket = self.rng.integers(0, totalBuckets)
         count = 0
-        while self.playerHashTable.getBuckets()[spawnBucket] and count < totalBuckets:
+        while not self.playerHashTable.isBucketEmpty(spawnBucket) and count < totalBuckets:
             spawnBucket = (spawnBucket + 1) % totalBuckets
             count += 1
         if count == totalBuckets:
-            xPos = numpy.random.randint(0, self.size)
-            yPos = numpy.random.randint(0, self.size)
+            xPos = self.rng.integers(0, self.size)
+            yPos = self.rng.integers(0, self.size)
         else:
             x = spawnBucket % cols
             y = (spawnBucket - x) / cols
             left = (x - 1)  * HASH_BUCKET_SIZE
             top =  y * HASH_BUCKET_SIZE
-            xPos = numpy.random.randint(left + radius, left + HASH_BUCKET_SIZE - radius)
-            yPos = numpy.random.randint(top + radius, top + HASH_BUCKET_SIZE - radius)
+            xPos = self.rng.integers(left + radius, left + HASH_BUCKET_SIZE - radius)
+            yPos = self.rng.integers(top + radius, top + HASH_BUCKET_SIZE - radius)
         return xPos, yPos
 
-    def spawnPellets(self):
-        while len(self.pellets) < self.maxCollectibleCount:
-            self.spawnPellet()
-
-    def spawnPellet(self):
-        xPos = numpy.random.randint(0, self.size)
-        yPos = numpy.random.randint(0, self.size)
-        size = randomSize()
-        pellet = Cell(xPos, yPos, size, None)
-        pellet.setName("Pellet")
-        self.addPellet(pellet)
+    # The positions, sizes and colors of all missing pellets are drawn at once, the pellets are added to the store
+    # and to the pellet hash table in bulk
+    def spawnPellets(self, countRespawns=True):
+        missing = int(math.ceil(self.maxCollectibleCount - self.cellStore.getCountOfKind(PELLET)))
+        if missing <= 0:
+            return
+        if countRespawns:
+            self.countStat("pelletsRespawned", missing)
+        positions = self.rng.integers(0, self.size, (missing, 2))
+        sizes = randomSizes(self.rng, missing)
+        colors = map(tuple, self.rng.integers(50, 200, (missing, 3)).tolist())
+        pellets = Cell.createMany(self.cellStore, positions, sizes, PELLET, colors, "Pellet")
+        self.pelletHashTable.insertAllObjects(pellets)
 
     # Cell1 eats Cell2. Therefore Cell1 grows and Cell2 is deleted
     def virusEatBlob(self, virus, blob):
-        self.eatCell(virus, self.virusHashTable, blob, self.blobHashTable, self.blobs)
+        self.eatCell(virus, self.virusHashTable, blob, self.blobHashTable)
         if virus.getMass() >= VIRUS_BASE_SIZE + 7 * EJECTEDBLOB_BASE_MASS * 0.8:
             oppositeX = 2 * virus.getPos()[0] - blob.getPos()[0]
             oppositeY = 2 * virus.getPos()[1] - blob.getPos()[1]
@@ -327,25 +496,27 @@ class Field(object):
             self.addVirus(newVirus)
 
     def eatPellet(self, playerCell, pellet):
-        self.eatCell(playerCell, self.playerHashTable, pellet, self.pelletHashTable, self.pellets)
+        self.eatCell(playerCell, self.playerHashTable, pellet, self.pelletHashTable)
 
     def eatBlob(self, playerCell, blob):
-        self.eatCell(playerCell, self.playerHashTable, blob, self.blobHashTable, self.blobs)
+        self.eatCell(playerCell, self.playerHashTable, blob, self.blobHashTable)
 
     def eatVirus(self, playerCell, virus):
-        self.eatCell(playerCell, self.playerHashTable, virus, self.virusHashTable, self.viruses, True)
+        self.eatCell(playerCell, self.playerHashTable, virus, self.virusHashTable, True)
         self.playerCellAteVirus(playerCell)
 
-    def eatCell(self, eatingCell, eatingCellHashtable, cell, cellHashtable, cellList, isVirus = None):
+    def eatCell(self, eatingCell, eatingCellHashtable, cell, cellHashtable, isVirus = None):
         mass = cell.getMass()
         if isVirus:
             mass *= VIRUS_EAT_FACTOR
+        self.countStat("overlapsFound")
         adjustCellSize(eatingCell, mass, eatingCellHashtable)
-        cellList.remove(cell)
         cellHashtable.deleteObject(cell)
+        self.cellStore.removeCell(cell)
         cell.setAlive(False)
 
     def eatPlayerCell(self, largerCell, smallerCell):
+        self.countStat("overlapsFound")
         adjustCellSize(largerCell, smallerCell.getMass(), self.playerHashTable)
         self.deletePlayerCell(smallerCell)
 
@@ -359,10 +530,10 @@ class Field(object):
         massPerCell = distributedMass / numberOfNewCells
         playerCell.resetMergeTime(MERGE_TIME_VIRUS_FACTOR)
         adjustCellSize(playerCell, -1 * massPerCell * numberOfNewCells, self.playerHashTable)
-        for cellIdx in range(numberOfNewCells):
+        cellAngles = numpy.deg2rad(self.rng.integers(0, 360, numberOfNewCells)).tolist()
+        for cellAngle in cellAngles:
             cellPos = playerCell.getPos()
-            newCell = Cell(cellPos[0], cellPos[1], massPerCell, player)
-            cellAngle = numpy.deg2rad(numpy.random.randint(0,360))
+            newCell = Cell(cellPos[0], cellPos[1], massPerCell, player, self.cellStore)
             xPoint = math.cos(cellAngle) * playerCell.getRadius() * 12 + cellPos[0]
             yPoint = math.sin(cellAngle) * playerCell.getRadius() * 12 + cellPos[1]
             movePoint = (xPoint, yPoint)
@@ -378,6 +549,7 @@ class Field(object):
         else:
             biggerCell = secondCell
             smallerCell = firstCell
+        self.countStat("merges")
         adjustCellSize(biggerCell, smallerCell.getMass(), self.playerHashTable)
         self.deletePlayerCell(smallerCell)
 
@@ -385,45 +557,44 @@ class Field(object):
         self.playerHashTable.deleteObject(playerCell)
         player = playerCell.getPlayer()
         player.removeCell(playerCell)
+        self.cellStore.removeCell(playerCell)
         if not player.getCells():
             self.deadPlayers.append(player)
             player.setDead()
 
     def addPellet(self, pellet):
         self.pelletHashTable.insertObject(pellet)
-        self.pellets.append(pellet)
+        self.cellStore.adopt(pellet, PELLET)
 
     def addBlob(self, blob):
         #self.blobHashTable.insertObject(blob)
-        self.blobs.append(blob)
+        self.cellStore.adopt(blob, BLOB)
 
     def addVirus(self, virus):
         #self.virusHashTable.insertObject(virus)
-        self.viruses.append(virus)
+        self.cellStore.adopt(virus, VIRUS)
 
     def addPlayerCell(self, playerCell):
         self.playerHashTable.insertObject(playerCell)
+        self.cellStore.adopt(playerCell, PLAYER)
         playerCell.getPlayer().addCell(playerCell)
 
-    def adjustCellPos(self, cell, newPos):
-        #hashtable.deleteObject(cell)
-        x = min(self.size, max(0, newPos[0]))
-        y = min(self.size, max(0, newPos[1]))
-        cell.setPos([x,y])
-        #hashtable.insertObject(cell)
-
     # Setters:
     def addPlayer(self, player):
         player.setAlive()
+        player.setId(len(self.players))
+        player.setCellStore(self.cellStore)
         self.players.append(player)
 
     # Getters:
+    def getRng(self):
+        return self.rng
+
     def getVirusEnabled(self):
         return self.virusEnabled
 
-    @staticmethod
-    def getPortionOfCellsInFov(cells, fovPos, fovSize):
-        return [cell for cell in cells if cell.isInFov(fovPos,fovSize)]
+    def getPortionOfCellsInFov(self, cells, fovPos, fovSize):
+        return self.cellStore.getCellsInFov(cells, fovPos, fovSize)
 
     def getPlayerCellsInFov(self, fovPos, fovSize):
         cellsNearFov = self.getCellsFromHashTableInFov(self.playerHashTable, fovPos, fovSize)
@@ -453,6 +624,14 @@ class Field(object):
         blobsNearFov = self.getCellsFromHashTableInFov(self.blobHashTable, fovPos, fovSize)
         return self.getPortionOfCellsInFov(blobsNearFov, fovPos, fovSize)
 
+    # Returns the rows of the pellets, the player cells and the viruses (if enabled) in the hash table buckets around
+    # the fov, in this order. They still have to be checked for being in the fov.
+    def getIdxsNearFov(self, fovPos, fovSize):
+        hashTables = [self.pelletHashTable, self.playerHashTable]
+        if self.virusEnabled:
+            hashTables.append(self.virusHashTable)
+        return numpy.concatenate([hashTable.getNearbyIdxsInArea(fovPos, fovSize / 2) for hashTable in hashTables])
+
     @staticmethod
     def getCellsFromHashTableInFov(hashtable, fovPos, fovSize):
         return hashtable.getNearbyObjectsInArea(fovPos, fovSize / 2)
@@ -463,14 +642,23 @@ class Field(object):
     def getHeight(self):
         return self.size
 
+    def getCellStore(self):
+        return self.cellStore
+
+    def getStats(self):
+        return self.stats
+
+    def getHashTables(self):
+        return self.pelletHashTable, self.blobHashTable, self.playerHashTable, self.virusHashTable
+
     def getPellets(self):
-        return self.pellets
+        return self.cellStore.getViewsOfKind(PELLET)
 
     def getBlobs(self):
-        return self.blobs
+        return self.cellStore.getViewsOfKind(BLOB)
 
     def getViruses(self):
-        return self.viruses
+        return self.cellStore.getViewsOfKind(VIRUS)
 
     def getPlayerCells(self):
         cells = []
@@ -0,0 +1,84 @@
+# Phases of Field.update in the order in which they are called
+UPDATE_PHASES = ("updateViruses", "updateBlobs", "updatePlayers", "updateHashTables", "mergePlayerCells",
+                 "checkOverlaps", "spawnStuff")
+
+HASH_TABLE_NAMES = ("pellets", "blobs", "players", "viruses")
+
+
+class FieldStats(object):
+    """ Timers and counters of the phases of Field.update. They are only collected for fields on which stats were
+    enabled (Field.enableStats), such that the update of other fields does not pay for them.
+    Counters:
+    cellsTested: candidate cells that the overlap checks tested against a player cell or a virus
+    cellPairs: pairs of player cells whose bounding boxes overlap, found by the broad phase of the player cells
+    overlapsFound: cells that were eaten because of an overlap (pellets, blobs, viruses and player cells)
+    merges: player cells that merged with another cell of the same player
+    pelletsRespawned: pellets that were spawned to replace eaten ones
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.updates = 0
+        self.phaseTimes = dict.fromkeys(UPDATE_PHASES, 0.0)
+        self.counters = {}
+        # Times and counters of the latest update
+        self.lastPhaseTimes = dict.fromkeys(UPDATE_PHASES, 0.0)
+        self.lastCounters = {}
+        # Occupancy of the hash tables after the latest update, and the biggest bucket seen since the reset
+        self.bucketStats = {}
+        self.maxBucketSizes = dict.fromkeys(HASH_TABLE_NAMES, 0)
+
+    def startUpdate(self):
+        self.updates += 1
+        self.lastCounters = {}
+
+    def addTime(self, phase, seconds):
+        self.phaseTimes[phase] += seconds
+        self.lastPhaseTimes[phase] = seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+        self.lastCounters[name] = self.lastCounters.get(name, 0) + value
+
+    def recordBucketSizes(self, hashTables):
+        for name, hashTable in zip(HASH_TABLE_NAMES, hashTables):
+            sizes = hashTable.getBucketSizes()
+            occupied = sizes[sizes > 0]
+            maxSize = int(occupied.max()) if len(occupied) else 0
+            self.maxBucketSizes[name] = max(self.maxBucketSizes[name], maxSize)
+            self.bucketStats[name] = {"entries": int(sizes.sum()),
+                                      "occupiedBuckets": len(occupied),
+                                      "buckets": len(sizes),
+                                      "meanOccupiedBucketSize": float(occupied.mean()) if len(occupied) else 0.0,
+                                      "maxBucketSize": maxSize,
+                                      "maxBucketSizeSinceReset": self.maxBucketSizes[name]}
+
+    # Returns the stats of the latest update
+    def getLast(self):
+        return {"phaseTimesMs": {phase: seconds * 1000 for phase, seconds in self.lastPhaseTimes.items()},
+                "counters": dict(self.lastCounters)}
+
+    # Marks the current totals, getSince returns the stats of the updates after the mark
+    def getMark(self):
+        return self.updates, dict(self.phaseTimes), dict(self.counters)
+
+    # Returns the number of updates and the summed times and counters of the updates since getMark was called
+    def getSince(self, mark):
+        updates, phaseTimes, counters = mark
+        return {"updates": self.updates - updates,
+                "phaseTimesMs": {phase: (seconds - phaseTimes[phase]) * 1000
+                                 for phase, seconds in self.phaseTimes.items()},
+                "counters": {name: value - counters.get(name, 0) for name, value in self.counters.items()
+                             if value != counters.get(name, 0)}}
+
+    # Returns the totals and the averages per update since the last reset
+    def getSummary(self):
+        updates = max(1, self.updates)
+        return {"updates": self.updates,
+                "phaseTimesMs": {phase: seconds * 1000 for phase, seconds in self.phaseTimes.items()},
+                "phaseTimesMsPerUpdate": {phase: seconds * 1000 / updates for phase, seconds in self.phaseTimes.items()},
+                "counters": dict(self.counters),
+                "countersPerUpdate": {name: value / updates for name, value in self.counters.items()},
+                "hashTables": dict(self.bucketStats)}
+
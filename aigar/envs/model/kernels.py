@@ -0,0 +1,339 @@
+""" Compiled loop kernels for the hot paths of the field: the kinematics and the push-apart of the player cells, the
+broad phase of the player cells, the narrow phase of the pellet eating and the insertion into and the queries of the
+flat hash table.
+
+Every kernel mirrors a numpy implementation in CellStore or FlatSpatialHashTable operation by operation, but runs as
+one fused loop without temporary arrays. The kernels are compiled with numba if it is installed. Without numba they
+are plain python functions, the field then keeps using the numpy implementations (see resolveKernelBackend) and the
+kernels are only run by checkKernels, which compares every kernel with its numpy implementation on random cells and
+fails if a kernel differs by more than its tolerance in KERNEL_TOLERANCES (see tests/test_kernels.py).
+"""
+import math
+
+import numpy
+
+from .parameters import *
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    numba = None
+    NUMBA_AVAILABLE = False
+
+KERNEL_BACKENDS = ("auto", "numpy", "numba")
+# The largest difference to the numpy implementation that checkKernels accepts. The integer and geometry kernels must
+# match exactly, updateCellProperties may differ in the last bits of atan2, cos and sin and is measured in ulps of the
+# largest value of each column
+KERNEL_TOLERANCES = {"updateCellProperties": 8, "updatePos": 0, "pushApart": 0, "sweepBoxPairs": 0,
+                     "findEdiblePairs": 0, "sortEntriesByBucket": 0, "gatherSlots": 0}
+
+
+def jit(function):
+    if NUMBA_AVAILABLE:
+        return numba.njit(cache=True)(function)
+    return function
+
+
+# Returns "numpy" or "numba" for one of KERNEL_BACKENDS, "auto" picks numba if it is installed
+def resolveKernelBackend(backend):
+    if backend not in KERNEL_BACKENDS:
+        raise ValueError("Unknown kernel backend " + str(backend) + ", choose one of " + str(list(KERNEL_BACKENDS)))
+    if backend == "auto":
+        return "numba" if NUMBA_AVAILABLE else "numpy"
+    if backend == "numba" and not NUMBA_AVAILABLE:
+        raise ImportError("The numba kernel backend needs numba, install it with: pip install numba")
+    return backend
+
+
+# CellStore.decayMass, updateMomentum, updateMerge and setMoveDirection in one pass, commandPoints has one row per idx
+@jit
+def updateCellProperties(pos, mass, radius, velocity, splitVelocity, splitVelocityCounter, mergeTime, idxs,
+                         commandPoints):
+    for i in range(len(idxs)):
+        idx = idxs[i]
+        if mass[idx] >= 4:
+            mass[idx] = mass[idx] * CELL_MASS_DECAY_RATE
+        radius[idx] = math.sqrt(max(mass[idx], 0.0) / math.pi)
+
+        counter = splitVelocityCounter[idx]
+        if counter > 0:
+            counter -= 1
+            counterRatio = counter / SPLIT_VELOCITY_COUNTER_MAX
+            if counterRatio < 0.1:
+                splitVelocity[idx, 0] *= 1 - counterRatio
+                splitVelocity[idx, 1] *= 1 - counterRatio
+        elif counter == 0:
+            splitVelocity[idx, 0] = 0.0
+            splitVelocity[idx, 1] = 0.0
+            counter = -1
+        splitVelocityCounter[idx] = counter
+
+        if mergeTime[idx] > 0:
+            mergeTime[idx] = mergeTime[idx] - 1
+
+        xDiff = commandPoints[i, 0] - pos[idx, 0]
+        yDiff = commandPoints[i, 1] - pos[idx, 1]
+        hypotenuseSquared = xDiff * xDiff + yDiff * yDiff
+        radiusSquared = radius[idx] * radius[idx]
+        speedModifier = min(hypotenuseSquared, radiusSquared) / radiusSquared
+        angle = math.atan2(yDiff, xDiff)
+        speed = CELL_MOVE_SPEED * mass[idx] ** -0.35 * speedModifier
+        velocity[idx, 0] = speed * math.cos(angle)
+        velocity[idx, 1] = speed * math.sin(angle)
+
+
+# CellStore.updatePos
+@jit
+def updatePos(pos, velocity, splitVelocity, splitVelocityCounter, idxs, maxX, maxY):
+    for i in range(len(idxs)):
+        idx = idxs[i]
+        moving = splitVelocityCounter[idx] != 0
+        for axis in range(2):
+            limit = maxX if axis == 0 else maxY
+            newPos = min(limit, max(0.0, pos[idx, axis] + (velocity[idx, axis] + splitVelocity[idx, axis])))
+            pos[idx, axis] = newPos
+            if (moving and newPos == limit) or newPos == 0:
+                splitVelocity[idx, axis] = -splitVelocity[idx, axis]
+
+
+# CellStore.pushApart. The displacements are summed in the same order as there: first the ones of the first cells
+# of all pairs, then the ones of the second cells
+@jit
+def pushApart(pos, mass, radius, splitVelocityCounter, mergeTime, first, second, maxX, maxY):
+    push = numpy.zeros((len(first), 2))
+    firstShare = numpy.zeros(len(first))
+    pushed = numpy.zeros(len(first), dtype=numpy.bool_)
+    for pairNr in range(len(first)):
+        idx1 = first[pairNr]
+        idx2 = second[pairNr]
+        xDiff = pos[idx1, 0] - pos[idx2, 0]
+        yDiff = pos[idx1, 1] - pos[idx2, 1]
+        distance = math.sqrt(xDiff * xDiff + yDiff * yDiff)
+        summedRadii = radius[idx1] + radius[idx2]
+        if not distance < summedRadii or distance == 0:
+            continue
+        if splitVelocityCounter[idx1] > 0 or splitVelocityCounter[idx2] > 0:
+            continue
+        if mergeTime[idx1] <= 0 and mergeTime[idx2] <= 0:
+            continue
+        # Share of the bigger cell, the smaller one moves by the rest
+        if mass[idx1] > mass[idx2]:
+            firstShare[pairNr] = mass[idx2] / mass[idx1]
+        else:
+            firstShare[pairNr] = 1 - mass[idx1] / mass[idx2]
+        scaling = (summedRadii - distance) / distance
+        push[pairNr, 0] = xDiff * scaling
+        push[pairNr, 1] = yDiff * scaling
+        pushed[pairNr] = True
+    pushedNrs = numpy.flatnonzero(pushed)
+    if not len(pushedNrs):
+        return
+    # The displacements are only accumulated for the moved rows, not for the whole store
+    moved = numpy.unique(numpy.concatenate((first[pushedNrs], second[pushedNrs])))
+    displacement = numpy.zeros((len(moved), 2))
+    for pairNr in pushedNrs:
+        movedNr = numpy.searchsorted(moved, first[pairNr])
+        displacement[movedNr, 0] += push[pairNr, 0] * firstShare[pairNr]
+        displacement[movedNr, 1] += push[pairNr, 1] * firstShare[pairNr]
+    for pairNr in pushedNrs:
+        movedNr = numpy.searchsorted(moved, second[pairNr])
+        displacement[movedNr, 0] += -push[pairNr, 0] * (1 - firstShare[pairNr])
+        displacement[movedNr, 1] += -push[pairNr, 1] * (1 - firstShare[pairNr])
+    for movedNr in range(len(moved)):
+        idx = moved[movedNr]
+        pos[idx, 0] = min(maxX, max(0.0, pos[idx, 0] + displacement[movedNr, 0]))
+        pos[idx, 1] = min(maxY, max(0.0, pos[idx, 1] + displacement[movedNr, 1]))
+
+
+# The sweep of CellStore.getOverlappingBoxPairs over the rows sorted by the left edge of their box. Returns the
+# positions (first, second) of the pairs with overlapping boxes, first < second, unordered
+@jit
+def sweepBoxPairs(order, left, right, y, radius):
+    count = len(order)
+    first = numpy.empty(0, dtype=numpy.int64)
+    second = numpy.empty(0, dtype=numpy.int64)
+    # The pairs are counted first, then written
+    numPairs = 0
+    for phase in range(2):
+        if phase == 1:
+            first = numpy.empty(numPairs, dtype=numpy.int64)
+            second = numpy.empty(numPairs, dtype=numpy.int64)
+            numPairs = 0
+        for sweepNr in range(count):
+            nr1 = order[sweepNr]
+            partnerNr = sweepNr + 1
+            while partnerNr < count and left[order[partnerNr]] <= right[nr1]:
+                nr2 = order[partnerNr]
+                if abs(y[nr1] - y[nr2]) <= radius[nr1] + radius[nr2]:
+                    if phase == 1:
+                        first[numPairs] = min(nr1, nr2)
+                        second[numPairs] = max(nr1, nr2)
+                    numPairs += 1
+                partnerNr += 1
+    return first, second
+
+
+# The test of Field.playerPelletOverlap: which of the (cell, pellet) pairs overlap and can be eaten
+@jit
+def findEdiblePairs(pos, mass, radius, cellIdxs, pairCells, pairPellets):
+    edible = numpy.empty(len(pairCells), dtype=numpy.bool_)
+    for pairNr in range(len(pairCells)):
+        cellIdx = cellIdxs[pairCells[pairNr]]
+        pelletIdx = pairPellets[pairNr]
+        xDiff = pos[pelletIdx, 0] - pos[cellIdx, 0]
+        yDiff = pos[pelletIdx, 1] - pos[cellIdx, 1]
+        cellRadius = radius[cellIdx]
+        edible[pairNr] = (xDiff * xDiff + yDiff * yDiff) * 1.1 < cellRadius * cellRadius and \
+            mass[cellIdx] > 1.25 * mass[pelletIdx]
+    return edible
+
+
+# The counting sort of FlatSpatialHashTable.rebuild: one entry per bucket covered by every slot, stably sorted by
+# bucket id. Fills bucketStarts and returns the entries and their buckets
+@jit
+def sortEntriesByBucket(liveSlots, colStart, colCount, rowStart, rowCount, cols, bucketStarts):
+    bucketStarts[:] = 0
+    total = 0
+    for i in range(len(liveSlots)):
+        for row in range(rowStart[i], rowStart[i] + rowCount[i]):
+            for col in range(colStart[i], colStart[i] + colCount[i]):
+                bucketStarts[col + row * cols + 1] += 1
+                total += 1
+    for bucket in range(1, len(bucketStarts)):
+        bucketStarts[bucket] += bucketStarts[bucket - 1]
+    nextEntry = bucketStarts[:-1].copy()
+    entries = numpy.empty(total, dtype=numpy.int64)
+    entryBuckets = numpy.empty(total, dtype=numpy.int64)
+    for i in range(len(liveSlots)):
+        for row in range(rowStart[i], rowStart[i] + rowCount[i]):
+            for col in range(colStart[i], colStart[i] + colCount[i]):
+                bucket = col + row * cols
+                entries[nextEntry[bucket]] = liveSlots[i]
+                entryBuckets[nextEntry[bucket]] = bucket
+                nextEntry[bucket] += 1
+    return entries, entryBuckets
+
+
+# The gather of FlatSpatialHashTable.getNearbySlotsInArea: the live slots in the bucket rectangle, every slot once
+@jit
+def gatherSlots(entries, entryBuckets, bucketStarts, slotLeft, slotTop, alive, colStart, colEnd, rowStart, rowEnd,
+                cols):
+    slots = numpy.empty(bucketStarts[rowEnd * cols - cols + colEnd] - bucketStarts[rowStart * cols + colStart],
+                        dtype=numpy.int64)
+    numSlots = 0
+    for row in range(rowStart, rowEnd):
+        for entry in range(bucketStarts[row * cols + colStart], bucketStarts[row * cols + colEnd]):
+            slot = entries[entry]
+            # An object that covers several of the queried buckets is only reported in the first of them
+            if alive[slot] and entryBuckets[entry] == max(slotLeft[slot], colStart) + max(slotTop[slot], rowStart) * cols:
+                slots[numSlots] = slot
+                numSlots += 1
+    return slots[:numSlots]
+
+
+# The largest difference of two columns in ulps of the largest absolute value of the expected column
+def getUlpDifference(expected, actual):
+    if not len(expected):
+        return 0.0
+    return float(numpy.abs(expected - actual).max() / numpy.spacing(numpy.abs(expected).max()))
+
+
+# Runs every kernel and its numpy implementation on the same random cells and returns the largest difference of their
+# results per kernel: in ulps for the kinematics, which use transcendental functions, and math.inf for a different
+# result of the kernels that are compared exactly
+def getKernelDifferences(numCells=500, seed=0):
+    from .cellStore import CellStore, COLUMNS, PLAYER
+    from .spatialHashTable import FlatSpatialHashTable
+
+    class View(object):
+        pass
+
+    rng = numpy.random.default_rng(seed)
+    size = 400
+    positions = rng.uniform(0, size, (numCells, 2))
+    positions[:10] = rng.choice([0.0, size], (10, 2))
+    masses = numpy.where(rng.random(numCells) < 0.5, 1.0, rng.uniform(2, 500, numCells))
+    velocity = rng.uniform(-3, 3, (numCells, 2))
+    splitVelocity = rng.uniform(-5, 5, (numCells, 2))
+    splitVelocityCounter = rng.integers(-1, SPLIT_VELOCITY_COUNTER_MAX + 1, numCells)
+    mergeTime = rng.integers(0, 3, numCells).astype(float)
+    commandPoints = rng.uniform(0, size, (numCells, 2))
+    queries = rng.uniform(0, size, (200, 3)) * [1, 1, 0.1]
+    idxs = numpy.arange(numCells)
+    pairs = numpy.triu_indices(numCells, 1)
+    # The first store runs the numpy implementations, the second one the kernels
+    stores = []
+    for useKernels in (False, True):
+        store = CellStore(numCells)
+        store.useKernels = useKernels
+        store.addMany([View() for _ in range(numCells)], positions, masses, PLAYER)
+        store.velocity[:numCells] = velocity
+        store.splitVelocity[:numCells] = splitVelocity
+        store.splitVelocityCounter[:numCells] = splitVelocityCounter
+        store.mergeTime[:numCells] = mergeTime
+        stores.append(store)
+
+    def columnDifference(name, inUlps=False):
+        numpyColumn = getattr(stores[0], name)[:numCells]
+        kernelColumn = getattr(stores[1], name)[:numCells]
+        if inUlps:
+            return getUlpDifference(numpyColumn, kernelColumn)
+        return float(numpy.abs(numpyColumn - kernelColumn).max())
+
+    # After every kernel the second store continues from the cells of the first one, such that the differences of
+    # the kernels do not add up
+    def synchronize():
+        for name in COLUMNS:
+            getattr(stores[1], name)[:numCells] = getattr(stores[0], name)[:numCells]
+
+    kinematicColumns = ("mass", "radius", "velocity", "splitVelocity", "splitVelocityCounter", "mergeTime")
+    differences = {}
+    for store in stores:
+        store.updateCellProperties(idxs, commandPoints)
+    differences["updateCellProperties"] = max(columnDifference(name, True) for name in kinematicColumns)
+    synchronize()
+    for store in stores:
+        store.updatePos(idxs, size, size)
+    differences["updatePos"] = max(columnDifference("pos"), columnDifference("splitVelocity"))
+    synchronize()
+    pairResults = [store.getOverlappingBoxPairs(idxs) for store in stores]
+    differences["sweepBoxPairs"] = 0.0 if all(numpy.array_equal(numpyPairs, kernelPairs) for numpyPairs, kernelPairs
+                                              in zip(*pairResults)) else math.inf
+    # Every cell tries to eat the cells whose box overlaps its own
+    pairCells = numpy.concatenate(pairResults[0])
+    pairPellets = numpy.concatenate(pairResults[0][::-1])
+    edible = [store.findEdiblePairs(idxs, pairCells, pairPellets) for store in stores]
+    differences["findEdiblePairs"] = 0.0 if numpy.array_equal(*edible) else math.inf
+    for store in stores:
+        store.pushApart(pairs[0], pairs[1], size, size)
+    differences["pushApart"] = columnDifference("pos")
+
+    tables = []
+    for store in stores:
+        table = FlatSpatialHashTable(size, 16)
+        table.insertAllObjects(store.views[:numCells])
+        tables.append(table)
+    queryResults = []
+    for store, table in zip(stores, tables):
+        slots = [table.getNearbySlotsInArea(query[:2], query[2]) for query in queries]
+        # Deleted objects are masked out until the next rebuild
+        for view in store.views[:numCells:7]:
+            table.deleteObject(view)
+        slots += [table.getNearbySlotsInArea(query[:2], query[2]) for query in queries]
+        queryResults.append(slots)
+    differences["sortEntriesByBucket"] = 0.0 if all(numpy.array_equal(getattr(tables[0], name), getattr(tables[1], name))
+                                                    for name in ("bucketStarts", "entries", "entryBuckets")) \
+        else math.inf
+    differences["gatherSlots"] = 0.0 if all(numpy.array_equal(numpySlots, kernelSlots) for numpySlots, kernelSlots
+                                            in zip(*queryResults)) else math.inf
+    return differences
+
+
+# Raises an AssertionError that names every kernel whose difference exceeds its tolerance, returns the differences
+def checkKernels(numCells=500, seed=0):
+    differences = getKernelDifferences(numCells, seed)
+    mismatches = [name + " (" + str(difference) + " > " + str(KERNEL_TOLERANCES[name]) + ")"
+                  for name, difference in differences.items() if difference > KERNEL_TOLERANCES[name]]
+    assert not mismatches, "Kernels differ from their numpy implementations: " + ", ".join(mismatches)
+    return differences
@@ -0,0 +1,136 @@
+import numpy
+
+from .parameters import RGB_RESOLUTION
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+
+# Discs with bigger bounding boxes (in pixels) are painted one by one instead of being expanded into pixel lists
+MAX_BATCHED_DISC_PIXELS = 1024
+
+
+class NumpyRGBGenerator:
+    """ Draws the rgb observations with numpy instead of pygame.
+    All cells in the fov are rasterized together: every cell is expanded into the pixels of its bounding box, the
+    pixels within its disc are painted in the order of the masses of the cells (bigger cells on top), and the colors
+    are written into the image in one pass. The image layout matches the pygame generator (indexed by [x][y]).
+    """
+    def __init__(self, field, parameters, length=RGB_RESOLUTION):
+        self.field = field
+        self.parameters = parameters
+        self.length = length
+        self.screenDims = numpy.array([self.length, self.length])
+        self.frame = numpy.empty((self.length, self.length, 3), dtype=numpy.uint8)
+        # Every pixel stores the paint that ends up on top of it, paint 0 is the white background
+        self.paintOfPixels = numpy.zeros(self.length * self.length, dtype=numpy.intp)
+
+    def getCellsInFov(self, player):
+        fovPos = player.getFovPos()
+        fovSize = player.getFovSize()
+        pellets = self.field.getPelletsInFov(fovPos, fovSize)
+        blobs = self.field.getBlobsInFov(fovPos, fovSize)
+        viruses = self.field.getVirusesInFov(fovPos, fovSize)
+        playerCells = self.field.getPlayerCellsInFov(fovPos, fovSize)
+        return pellets + blobs + viruses + playerCells
+
+    def drawAllCells(self, player, image):
+        paintOfPixels = self.paintOfPixels
+        paintOfPixels.fill(0)
+        cells = self.getCellsInFov(player)
+        if cells:
+            store = self.field.getCellStore()
+            idxs = numpy.array([cell.storeIdx for cell in cells])
+            order = numpy.argsort(store.mass[idxs], kind="stable")
+            cells = [cells[i] for i in order]
+            idxs = idxs[order]
+            fovPos = player.getFovPos()
+            fovSize = player.getFovSize()
+            pos = self.modelToViewScaling(store.pos[idxs], fovPos, fovSize).astype(int)
+            rad = self.modelToViewScaleRadius(store.radius[idxs], fovSize).astype(int)
+            colors = numpy.array([cell.getColor() for cell in cells], dtype=numpy.uint8)
+            # Viruses get a black surrounding circle
+            outlined = numpy.array([cell.getName() == "Virus" for cell in cells]) & (rad >= 4)
+            self.paintDiscs(paintOfPixels, pos, rad, outlined)
+            # Paint 2 * i + 1 is the fill of the i-th cell, paint 2 * i + 2 its outline
+            palette = numpy.empty((2 * len(cells) + 1, 3), dtype=numpy.uint8)
+            palette[0] = WHITE
+            palette[1::2] = colors
+            palette[2::2] = BLACK
+        else:
+            palette = numpy.array([WHITE], dtype=numpy.uint8)
+        # The paints are always valid indices, mode="clip" avoids that take buffers the output
+        numpy.take(palette, paintOfPixels, axis=0, out=image.reshape(-1, 3), mode="clip")
+
+    # Paints the discs into paintOfPixels. Later discs are painted over earlier ones. The paints only ever grow, so
+    # the order in which the discs are processed does not matter.
+    def paintDiscs(self, paintOfPixels, pos, rad, outlined):
+        length = self.length
+        left = numpy.clip(pos[:, 0] - rad, 0, length)
+        right = numpy.clip(pos[:, 0] + rad + 1, 0, length)
+        top = numpy.clip(pos[:, 1] - rad, 0, length)
+        bottom = numpy.clip(pos[:, 1] + rad + 1, 0, length)
+        widths = right - left
+        heights = bottom - top
+        # Discs with a radius below one pixel are not drawn, like with pygame.draw.circle
+        counts = numpy.where(rad >= 1, widths * heights, 0)
+        paintGrid = paintOfPixels.reshape(length, length)
+        for disc in numpy.flatnonzero(counts > MAX_BATCHED_DISC_PIXELS):
+            xDiff = numpy.arange(left[disc], right[disc], dtype=numpy.intp) - pos[disc, 0]
+            yDiff = numpy.arange(top[disc], bottom[disc], dtype=numpy.intp) - pos[disc, 1]
+            squaredDistance = (xDiff * xDiff)[:, None] + (yDiff * yDiff)[None, :]
+            discRad = rad[disc]
+            paint = (squaredDistance <= discRad * discRad).astype(numpy.intp)
+            paint *= 2 * disc + 1
+            if outlined[disc]:
+                paint[(paint > 0) & (squaredDistance > (discRad - 1) * (discRad - 1))] += 1
+            box = paintGrid[left[disc]:right[disc], top[disc]:bottom[disc]]
+            numpy.maximum(box, paint, out=box)
+        counts[counts > MAX_BATCHED_DISC_PIXELS] = 0
+        numPixels = counts.sum()
+        if not numPixels:
+            return
+        # Expand the bounding boxes into a flat list of (disc, pixel) pairs
+        discs = numpy.repeat(numpy.arange(len(pos)), counts)
+        pixelNrs = numpy.arange(numPixels) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        x = left[discs] + pixelNrs % widths[discs]
+        y = top[discs] + pixelNrs // widths[discs]
+        xDiff = x - pos[discs, 0]
+        yDiff = y - pos[discs, 1]
+        squaredDistance = xDiff * xDiff + yDiff * yDiff
+        discRad = rad[discs]
+        inside = squaredDistance <= discRad * discRad
+        onOutline = outlined[discs] & (squaredDistance > (discRad - 1) * (discRad - 1))
+        paints = (2 * discs + 1 + onOutline).astype(numpy.intp)
+        numpy.maximum.at(paintOfPixels, (x * self.length + y)[inside], paints[inside])
+
+    def modelToViewScaling(self, pos, fovPos, fovSize):
+        adjustedPos = pos - fovPos + (fovSize / 2)
+        scaledPos = adjustedPos * (self.screenDims / fovSize)
+        return scaledPos
+
+    def viewToModelScaling(self, pos, fovPos, fovSize):
+        scaledPos = pos / (self.screenDims / fovSize)
+        adjustedPos = scaledPos + fovPos - (fovSize / 2)
+        return adjustedPos
+
+    def modelToViewScaleRadius(self, rad, fovSize):
+        return rad * (self.screenDims[0] / fovSize)
+
+    def draw_cnnInput(self, player):
+        self.drawAllCells(player, self.frame)
+
+    # Draws the image and copies it into out if it is given, otherwise into a new array
+    def get_cnn_inputRGB(self, player, out=None):
+        self.draw_cnnInput(player)
+        return self.getFrame(out)
+
+    # Returns the last drawn image without drawing it again
+    def getFrame(self, out=None):
+        if out is None:
+            return self.frame.copy()
+        out[:] = self.frame
+        return out
+
+    # The returned view is overwritten by the next drawing
+    def getFrameView(self):
+        return self.frame
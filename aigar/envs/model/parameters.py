@@ -15,6 +15,8 @@ SCREEN_WIDTH = 300
 SCREEN_HEIGHT = 300
 MAXHUMANPLAYERS = 3
 GRID_SQUARES_PER_FOV = 11
+RGB_RESOLUTION = 900  # Side length in pixels of the rgb observations
+RGB_BACKEND = "pygame"  # "pygame" (drawn with pygame.gfxdraw) or "numpy" (batched numpy rasterizer, no pygame needed)
 NUM_OF_GRIDS = 4 + VIRUS_SPAWN
 NORMALIZE_GRID_BY_MAX_MASS = False
 PELLET_GRID = True
@@ -30,7 +32,12 @@ SPEED_MODIFIER = GAME_SPEED / FPS
 
 # Field Parameters
 HASH_BUCKET_SIZE = 20
+HASH_TABLE_BACKEND = "dict"  # "dict" (buckets of python lists) or "flat" (array-backed, sorted by bucket)
+KERNEL_BACKEND = "auto"  # "auto" (numba if it is installed, otherwise numpy), "numpy" or "numba" (compiled loops)
+RESET_MODE = "respawn"  # "respawn" (everything is spawned anew) or "snapshot" (players and viruses restart where they started in the first episode, only the pellets are redrawn)
+FRAME_SKIP = 1  # Field updates per env step, the action is repeated and only the last update is observed
 SIZE_INCREASE_PER_PLAYER = 75
+FIELD_SCALE = 1  # Side length of the field relative to the default of SIZE_INCREASE_PER_PLAYER * sqrt(players), pellets and viruses keep their density
 START_MASS = 10
 START_RADIUS = math.sqrt(START_MASS / math.pi)
 # per unit area
@@ -50,6 +57,7 @@ MERGE_TIME_MASS_FACTOR = 0.0233
 MERGE_TIME_VIRUS_FACTOR = 0.85
 CELL_MOVE_SPEED = 90 * SPEED_MODIFIER #units/sec
 CELL_MASS_DECAY_RATE = 1 - (0.01 * SPEED_MODIFIER) #default: 1- (0.01 * SPEED_MODIFIER)
+SPLIT_VELOCITY_COUNTER_MAX = 15
 
 
 # Player Parameters:
@@ -1,5 +1,4 @@
-from random import randint
-
+import numpy
 from numpy import sum
 
 class Player(object):
@@ -13,6 +12,8 @@ class Player(object):
         self.color = None
         self.randomizeColor()
         self.name = name
+        self.id = None
+        self.cellStore = None
         self.cells = []
         self.canSplit = False
         self.canEject = False
@@ -28,28 +29,12 @@ class Player(object):
         self.selected = False
         self.exploring = False
 
-    def update(self, fieldWidth, fieldHeight):
-        if self.isAlive:
-            self.decayMass()
-            self.updateCellProperties()
-            self.split(fieldWidth, fieldHeight)
-            self.eject()
-            self.updateCellsMovement(fieldWidth, fieldHeight)
-
-    def randomizeColor(self):
-        self.color = (randint(0, 255), randint(0, 255), randint(0, 255))
-        if sum(self.color) > 600:
-            self.randomizeColor()
-
-    def decayMass(self):
-        for cell in self.cells:
-            cell.decayMass()
-
-    def updateCellProperties(self):
-        for cell in self.cells:
-            cell.updateMomentum()
-            cell.updateMerge()
-            cell.setMoveDirection(self.commandPoint)
+    def randomizeColor(self, rng=None):
+        if rng is None:
+            rng = numpy.random.default_rng()
+        self.color = tuple(rng.integers(0, 256, 3).tolist())
+        while sum(self.color) > 600:
+            self.color = tuple(rng.integers(0, 256, 3).tolist())
 
     def split(self, fieldWidth, fieldHeight):
         if not self.doSplit:
@@ -68,14 +53,29 @@ class Player(object):
             if cell.canEject():
                 cell.prepareEject()
 
-    def updateCellsMovement(self, fieldWidth, fieldHeight):
-        for cell in self.cells:
-            cell.updatePos(fieldWidth, fieldHeight)
-
     def updateRespawnTime(self):
         self.respawnTime -= 1
 
+    # The cell objects are kept, together with their eject commands
+    def snapshot(self):
+        return (list(self.cells), [cell.getBlobToBeEjected() for cell in self.cells], self.isAlive, self.respawnTime,
+                list(self.commandPoint), self.doSplit, self.doEject, self.fovPos, self.fovSize, self.color)
+
+    def restore(self, snapshot):
+        cells, blobsToBeEjected, self.isAlive, self.respawnTime, commandPoint, self.doSplit, self.doEject, \
+            self.fovPos, self.fovSize, self.color = snapshot
+        self.cells = list(cells)
+        self.commandPoint = list(commandPoint)
+        for cell, blobToBeEjected in zip(self.cells, blobsToBeEjected):
+            cell.blobToBeEjected = blobToBeEjected
+
     # Setters:
+    def setId(self, val):
+        self.id = val
+
+    def setCellStore(self, store):
+        self.cellStore = store
+
     def setExploring(self, val):
         self.exploring = val
 
@@ -128,11 +128,15 @@ class Player(object):
         return self.respawnTime
 
     def getTotalMass(self):
-        return sum([cell.getMass() for cell in self.cells]) if self.cells else 0
+        return self.cellStore.mass[self.getCellIdxs()].sum() if self.cells else 0
 
     def getCells(self):
         return self.cells
 
+    # Rows of the player's cells in the cell store of the field
+    def getCellIdxs(self):
+        return numpy.array([cell.storeIdx for cell in self.cells], dtype=numpy.int64)
+
     def getMergableCells(self):
         cells = []
         for cell in self.cells:
@@ -156,14 +160,18 @@ class Player(object):
 
     def getFovPos(self):
         if self.isAlive and self.getTotalMass() != 0:
-            meanX = sum([cell.getX() * cell.getMass() for cell in self.cells]) / self.getTotalMass()
-            meanY = sum([cell.getY() * cell.getMass() for cell in self.cells]) / self.getTotalMass()
+            cellIdxs = self.getCellIdxs()
+            store = self.cellStore
+            mass = store.mass[cellIdxs]
+            totalMass = mass.sum()
+            meanX = (store.pos[cellIdxs, 0] * mass).sum() / totalMass
+            meanY = (store.pos[cellIdxs, 1] * mass).sum() / totalMass
             self.fovPos = [meanX, meanY]
         return self.fovPos
 
     def getFovSize(self):
         if self.isAlive:
-            biggestCellRadius = max(self.cells, key=lambda p: p.getRadius()).getRadius()
+            biggestCellRadius = self.cellStore.radius[self.getCellIdxs()].max()
             self.fovSize = (biggestCellRadius ** 0.475) * (len(self.cells) ** 0.32) * 35
         return self.fovSize
 
@@ -178,6 +186,9 @@ class Player(object):
     def getName(self):
         return self.name
 
+    def getId(self):
+        return self.id
+
     def getIsAlive(self):
         return self.isAlive
 
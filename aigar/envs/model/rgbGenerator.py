@@ -5,20 +5,25 @@ import pygame
 import numpy
 from pygame import gfxdraw
 
+from .parameters import RGB_RESOLUTION
+
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 GREEN = (0, 255, 0)
 
 class RGBGenerator:
-    def __init__(self, field, parameters):
+    def __init__(self, field, parameters, length=RGB_RESOLUTION):
         self.field = field
         self.parameters = parameters
 
-        self.length = 900
+        # The cells are drawn directly at the resolution of the observation
+        self.length = length
 
         self.screenDims = numpy.array([self.length, self.length])
         self.screen = pygame.Surface((self.length, self.length))
+        # View onto the pixels of the screen, such that the drawn image can be read without copying the surface
+        self.frame = pygame.surfarray.pixels3d(self.screen)
 
         #self.screen = pygame.display.set_mode(self.screenDims)
 
@@ -92,12 +97,23 @@ class RGBGenerator:
     def modelToViewScaleRadius(self, rad, fovSize):
         return rad * (self.screenDims[0] / fovSize)
 
-    def get_cnn_inputRGB(self, player):
+    # Draws the image and copies it into out if it is given, otherwise into a new array
+    def get_cnn_inputRGB(self, player, out=None):
         self.draw_cnnInput(player)
-        imgdata = pygame.surfarray.array3d(self.screen)
         #if not self.parameters.CNN_P_RGB:
         #    imgdata = self.grayscale(imgdata)
-        return imgdata
+        return self.getFrame(out)
+
+    # Returns the last drawn image without drawing it again
+    def getFrame(self, out=None):
+        if out is None:
+            return numpy.array(self.frame)
+        out[:] = self.frame
+        return out
+
+    # The returned view is overwritten by the next drawing
+    def getFrameView(self):
+        return self.frame
 
     def grayscale(self, arr):
         arr = numpy.average(arr, axis=2, weights=[0.298, 0.587, 0.114])
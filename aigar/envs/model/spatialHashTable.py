@@ -1,21 +1,11 @@
 import math
 
-# Numba support for dicts is too experimental as of yet
-#from numba import jitclass, int32, float32
-#from numba.typed import Dict
-
-#spec = [
-#    ('left', int32),               # a simple scalar field
-#    ('top', int32),
-#    ('size', int32),
-#    ('rows', int32),
-#    ('cols', int32),
-#    ('bucketsize', int32),
-#    ('buckets', Dict),      
-#]
-
-
-#@jitclass(spec)
+import numpy
+
+from . import kernels
+
+# Numba support for dicts is too experimental as of yet, so this table stays in python. FlatSpatialHashTable runs the
+# loop kernels of the kernels module, which are compiled with numba if it is installed
 class SpatialHashTable:
     def __repr__(self):
         name = "Hash table: \n"
@@ -35,8 +25,10 @@ class SpatialHashTable:
         self.rows = int(math.ceil(hashTableSize / bucketSize))
         self.cols = self.rows
         self.bucketSize = bucketSize
-        self.buckets = {}
-        self.clearBuckets()
+        self.buckets = {i: [] for i in range(self.cols * self.rows)}
+        # Every object is tracked with the bucket range it covers and the resulting bucket ids, such that moving
+        # objects only need to be re-bucketed once their covered range changes
+        self.objectIds = {}
 
     def getNearbyObjects(self, obj):
         cellIds = self.getIdsForObj(obj)
@@ -46,36 +38,124 @@ class SpatialHashTable:
         cellIds = self.getIdsForArea(pos, rad)
         return self.getObjectsFromBuckets(cellIds)
 
+    # Returns the rows of the nearby objects in their cell store
+    def getNearbyIdxsInArea(self, pos, radius):
+        return numpy.array([obj.storeIdx for obj in self.getNearbyObjectsInArea(pos, radius)], dtype=numpy.int64)
+
     def getNearbyEnemyObjects(self, obj):
         cellIds = self.getIdsForObj(obj)
         nearbyObjects = self.getObjectsFromBuckets(cellIds)
         return [nearbyObject for nearbyObject in nearbyObjects if nearbyObject.getPlayer() is not obj.getPlayer()]
 
+    # The objects are returned in a reproducible order (not ordered by their memory addresses like a set would be)
     def getObjectsFromBuckets(self, cellIds):
-        nearbyObjects = set()
+        nearbyObjects = {}
         for cellId in cellIds:
             for cell in self.buckets[cellId]:
-                nearbyObjects.add(cell)
-        return nearbyObjects
+                nearbyObjects[cell] = None
+        return list(nearbyObjects)
 
+    # Only the buckets that contain objects are emptied, the other buckets are left untouched
     def clearBuckets(self):
-        for i in range(self.cols * self.rows):
-            self.buckets[i] = []
+        for id in self.getOccupiedBucketIds():
+            self.buckets[id] = []
+        self.objectIds = {}
+
+    # The occupied buckets are found through the objects or through the buckets, whichever there are fewer of, such
+    # that large tables with few objects are not scanned completely
+    def getOccupiedBucketIds(self):
+        if len(self.objectIds) > len(self.buckets):
+            return [id for id, bucket in self.buckets.items() if bucket]
+        return {id for key, ids in self.objectIds.values() for id in ids}
 
     def insertObject(self, obj):
-        cellIds = self.getIdsForObj(obj)
+        key = self.getAreaKeyForObj(obj)
+        cellIds = self.getIdsForKey(key)
         for id in cellIds:
             self.buckets[id].append(obj)
+        self.objectIds[obj] = (key, cellIds)
 
+    # Inserts the objects in bulk: the bucket ranges of all objects are computed with array operations from the
+    # store columns. The buckets receive the objects in the same order as with one insertObject call per object.
+    # The bucket ids of an object are kept as a tuple, which is much cheaper to create for many objects than a set.
     def insertAllObjects(self, objects):
-        for obj in objects:
+        objects = list(objects)
+        if not objects:
+            return
+        store = objects[0].store
+        if any(obj.store is not store for obj in objects):
+            for obj in objects:
+                self.insertObject(obj)
+            return
+        storeIdxs = numpy.array([obj.storeIdx for obj in objects], dtype=numpy.int64)
+        pos = store.pos[storeIdxs]
+        keys = getAreaKeys(pos[:, 0], pos[:, 1], store.radius[storeIdxs], self.size, self.bucketSize)
+        bucketLeft, limitX, bucketTop, limitY = keys
+        colCounts = numpy.maximum(0, -((bucketLeft - limitX) // self.bucketSize))
+        rowCounts = numpy.maximum(0, -((bucketTop - limitY) // self.bucketSize))
+        # Expand every object into the ids of the buckets it covers
+        counts = colCounts * rowCounts
+        offsets = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        entryRowCounts = numpy.repeat(rowCounts, counts)
+        entryCols = numpy.repeat(bucketLeft // self.bucketSize, counts) + offsets // entryRowCounts
+        entryRows = numpy.repeat(bucketTop // self.bucketSize, counts) + offsets % entryRowCounts
+        ids = (entryCols + entryRows * self.cols).tolist()
+        ends = numpy.cumsum(counts).tolist()
+        buckets = self.buckets
+        start = 0
+        for obj, key, end in zip(objects, zip(*(key.tolist() for key in keys)), ends):
+            cellIds = ids[start:end]
+            for id in cellIds:
+                buckets[id].append(obj)
+            self.objectIds[obj] = (key, tuple(cellIds))
+            start = end
+
+    # The bucket lists are copied, the entries of objectIds are never modified in place and can be shared
+    def snapshot(self):
+        return {id: list(self.buckets[id]) for id in self.getOccupiedBucketIds()}, dict(self.objectIds)
+
+    def restore(self, snapshot):
+        buckets, objectIds = snapshot
+        self.clearBuckets()
+        for id, bucket in buckets.items():
+            self.buckets[id] = list(bucket)
+        self.objectIds = dict(objectIds)
+
+    # Re-buckets an object if the range of buckets it covers changed since it was inserted or last updated
+    def updateObject(self, obj):
+        entry = self.objectIds.get(obj)
+        if entry is None:
             self.insertObject(obj)
+            return
+        key = self.getAreaKeyForObj(obj)
+        oldKey, oldIds = entry
+        if key == oldKey:
+            return
+        newIds = self.getIdsForKey(key)
+        for id in oldIds:
+            if id not in newIds:
+                self.buckets[id].remove(obj)
+        for id in newIds.difference(oldIds):
+            self.buckets[id].append(obj)
+        self.objectIds[obj] = (key, newIds)
+
+    # Makes the table contain exactly the given objects: objects that are not given anymore are deleted, new ones
+    # are inserted and the others are re-bucketed if they moved to a different bucket range
+    def updateAllObjects(self, objects):
+        objects = list(objects)
+        if len(objects) != len(self.objectIds) or not all(obj in self.objectIds for obj in objects):
+            current = set(objects)
+            for obj in [obj for obj in self.objectIds if obj not in current]:
+                self.deleteObject(obj)
+        for obj in objects:
+            self.updateObject(obj)
 
-    # Deletes an object out of all the buckets it is in. Might not be needed as it might
-    # be faster to clear all buckets and reinsert items than updating objects.
+    # Deletes an object out of all the buckets it was inserted into
     def deleteObject(self, obj):
-        cellIds = self.getIdsForObj(obj)
-        for id in cellIds:
+        entry = self.objectIds.pop(obj, None)
+        if entry is None:
+            return
+        for id in entry[1]:
             self.buckets[id].remove(obj)
 
     def getIdsForObj(self, obj):
@@ -83,25 +163,36 @@ class SpatialHashTable:
         radius = obj.getRadius()
         return self.getIdsForArea(pos, radius)
 
-    def getIdsForArea(self, pos, radius):
-        ids = set()
+    def getAreaKeyForObj(self, obj):
+        return self.getAreaKey(obj.getPos(), obj.getRadius())
+
+    # The bucket range covered by a circle, as the bounds used to iterate over the buckets
+    def getAreaKey(self, pos, radius):
         cellLeft = max(0, pos[0] - radius)
         cellTop = max(0, pos[1] - radius)
         bucketLeft = int(cellLeft - cellLeft % self.bucketSize)
         bucketTop = int(cellTop - cellTop % self.bucketSize)
         limitX = int(min(self.size, pos[0] + radius + 1))
         limitY = int(min(self.size, pos[1] + radius + 1))
+        return bucketLeft, limitX, bucketTop, limitY
 
+    def getIdsForKey(self, key):
+        bucketLeft, limitX, bucketTop, limitY = key
+        ids = set()
         for x in range(bucketLeft, limitX, self.bucketSize):
             for y in range(bucketTop, limitY, self.bucketSize):
                 ids.add(self.getHashId(x, y, self.bucketSize, self.cols))
         return ids
 
+    def getIdsForArea(self, pos, radius):
+        return self.getIdsForKey(self.getAreaKey(pos, radius))
+
     def insertAllFloatingPointObjects(self, objects):
         for obj in objects:
             ids = self.getIdsForAreaFloatingPoint(obj.getPos(), obj.getRadius())
             for id in ids:
                 self.buckets[id].append(obj)
+            self.objectIds[obj] = (None, ids)
                     
     def getIdsForAreaFloatingPoint(self, pos, radius):
         ids = set()
@@ -138,6 +229,13 @@ class SpatialHashTable:
     def getBucketContent(self, idx):
         return self.buckets[idx]
 
+    def isBucketEmpty(self, idx):
+        return not self.buckets[idx]
+
+    # Number of objects in every bucket, ordered by bucket id
+    def getBucketSizes(self):
+        return numpy.array([len(bucket) for bucket in self.buckets.values()], dtype=numpy.int64)
+
     def getCenterOfBucket(self, id):
         x = id % self.cols * self.bucketSize + self.bucketSize / 2
         y = int(id /self.cols) * self.bucketSize + self.bucketSize / 2
@@ -154,3 +252,274 @@ class SpatialHashTable:
         return self.getCenterOfBucket(startId)
 
         #[(return self.getObjectsFromBuckets(self.getHashId(pos))]
+
+
+# Vectorized version of SpatialHashTable.getAreaKey, returns the four bounds of the bucket range of every circle
+def getAreaKeys(x, y, radius, size, bucketSize):
+    cellLeft = numpy.maximum(0, x - radius)
+    cellTop = numpy.maximum(0, y - radius)
+    bucketLeft = (cellLeft - cellLeft % bucketSize).astype(numpy.int64)
+    bucketTop = (cellTop - cellTop % bucketSize).astype(numpy.int64)
+    limitX = numpy.minimum(size, x + radius + 1).astype(numpy.int64)
+    limitY = numpy.minimum(size, y + radius + 1).astype(numpy.int64)
+    return bucketLeft, limitX, bucketTop, limitY
+
+
+# Vectorized version of SpatialHashTable.getIdsForAreaFloatingPoint for many circles at once.
+# The bucket coordinates are stepped by repeated addition, exactly like in the scalar version, such that both
+# versions agree bitwise. Returns the circle number and the bucket id of every covered (circle, bucket) pair,
+# ordered by circle number. The position and size of the table can be given per circle.
+def getIdsForAreasFloatingPoint(x, y, radius, left, top, size, bucketSize, cols):
+    circleCols, validCols = getFloatingPointSteps(x - left, radius, size, bucketSize)
+    circleRows, validRows = getFloatingPointSteps(y - top, radius, size, bucketSize)
+    ids = circleCols[:, :, None] + circleRows[:, None, :] * numpy.reshape(cols, (-1, 1, 1))
+    valid = validCols[:, :, None] & validRows[:, None, :]
+    circleNrs = numpy.broadcast_to(numpy.arange(len(x))[:, None, None], ids.shape)
+    return circleNrs[valid], ids[valid]
+
+
+# Returns the bucket indices covered along one axis by each circle and a mask of the valid ones
+def getFloatingPointSteps(pos, radius, size, bucketSize):
+    cellStart = numpy.maximum(0, pos - radius)
+    bucketStart = cellStart - cellStart % bucketSize
+    limit = numpy.minimum(size - 1, pos + radius)
+    steps = [bucketStart]
+    while True:
+        nextStep = steps[-1] + bucketSize
+        if not (nextStep <= limit).any():
+            break
+        steps.append(nextStep)
+    steps = numpy.stack(steps, axis=1)
+    indices = (steps / numpy.reshape(bucketSize, (-1, 1))).astype(numpy.int64)
+    valid = steps <= limit[:, None]
+    # Rounding can map two consecutive steps onto the same bucket, the scalar version keeps ids in a set
+    valid[:, 1:] &= indices[:, 1:] != indices[:, :-1]
+    return indices, valid
+
+
+class FlatSpatialHashTable:
+    """ Spatial hash table with a flat, array-backed layout (compressed sparse rows).
+    All (bucket, object) entries are counting-sorted by bucket id into one entry array, bucketStarts[id] points to the
+    first entry of a bucket. Queries gather the entry slices of the covered bucket rows and return index arrays
+    into the object slots instead of allocating sets. Insertions and updates only mark the table dirty, the layout is
+    rebuilt from the current object positions before the next query. Deleted objects are masked out until then.
+    It is a drop-in replacement for SpatialHashTable for objects that are views of one CellStore.
+    """
+    def __repr__(self):
+        name = "Flat hash table: \n"
+        name += "Rows: " + str(self.rows) + " Cols: " + str(self.cols) + " Cellsize: " + str(self.bucketSize) + "\n"
+        name += "Total objects in table: " + str(len(self.slots))
+        return name
+
+    def __init__(self, hashTableSize, bucketSize, left = 0, top = 0):
+        self.left = left
+        self.top = top
+        self.size = hashTableSize
+        self.rows = int(math.ceil(hashTableSize / bucketSize))
+        self.cols = self.rows
+        self.bucketSize = bucketSize
+        self.numBuckets = self.rows * self.cols
+        self.clearBuckets()
+
+    def clearBuckets(self):
+        self.objects = []  # slot -> object, None for deleted objects
+        self.slots = {}  # object -> slot
+        self.alive = numpy.zeros(0, dtype=bool)
+        self.slotLeft = numpy.zeros(0, dtype=numpy.int64)  # first bucket column covered by the object in a slot
+        self.slotTop = numpy.zeros(0, dtype=numpy.int64)  # first bucket row covered by the object in a slot
+        self.bucketStarts = numpy.zeros(self.numBuckets + 1, dtype=numpy.int64)
+        self.entries = numpy.zeros(0, dtype=numpy.int64)  # slots, sorted by bucket
+        self.entryBuckets = numpy.zeros(0, dtype=numpy.int64)
+        self.numDead = 0  # objects deleted since the last rebuild, they are still in the entries
+        self.dirty = False
+        self.useKernels = False  # taken over from the cell store of the objects by every rebuild
+
+    def insertObject(self, obj):
+        self.slots[obj] = len(self.objects)
+        self.objects.append(obj)
+        self.dirty = True
+
+    def insertAllObjects(self, objects):
+        slot = len(self.objects)
+        self.objects.extend(objects)
+        self.slots.update(zip(self.objects[slot:], range(slot, len(self.objects))))
+        self.dirty = True
+
+    # Only the arrays that are modified in place are copied, the others are replaced by every rebuild
+    def snapshot(self):
+        return (list(self.objects), dict(self.slots), self.alive.copy(), self.slotLeft, self.slotTop,
+                self.bucketStarts.copy(), self.entries, self.entryBuckets, self.numDead, self.dirty)
+
+    def restore(self, snapshot):
+        objects, slots, alive, self.slotLeft, self.slotTop, bucketStarts, self.entries, self.entryBuckets, \
+            self.numDead, self.dirty = snapshot
+        self.objects = list(objects)
+        self.slots = dict(slots)
+        self.alive = alive.copy()
+        self.bucketStarts = bucketStarts.copy()
+
+    def updateObject(self, obj):
+        if obj not in self.slots:
+            self.insertObject(obj)
+        self.dirty = True
+
+    def updateAllObjects(self, objects):
+        objects = list(objects)
+        if len(objects) != len(self.slots) or not all(obj in self.slots for obj in objects):
+            self.clearBuckets()
+            self.objects = objects
+            self.slots = {obj: slot for slot, obj in enumerate(objects)}
+        self.dirty = True
+
+    def deleteObject(self, obj):
+        slot = self.slots.pop(obj, None)
+        if slot is None:
+            return
+        self.objects[slot] = None
+        if slot < len(self.alive):
+            self.alive[slot] = False
+            self.numDead += 1
+
+    # Recomputes the bucket ranges of all objects and counting-sorts their entries by bucket id
+    def rebuild(self):
+        if len(self.slots) < len(self.objects) // 2:
+            self.objects = [obj for obj in self.objects if obj is not None]
+            self.slots = {obj: slot for slot, obj in enumerate(self.objects)}
+        numSlots = len(self.objects)
+        self.alive = numpy.array([obj is not None for obj in self.objects], dtype=bool)
+        liveSlots = numpy.flatnonzero(self.alive)
+        self.slotLeft = numpy.zeros(numSlots, dtype=numpy.int64)
+        self.slotTop = numpy.zeros(numSlots, dtype=numpy.int64)
+        self.numDead = 0
+        self.dirty = False
+        if not len(liveSlots):
+            self.bucketStarts[:] = 0
+            self.entries = numpy.zeros(0, dtype=numpy.int64)
+            self.entryBuckets = numpy.zeros(0, dtype=numpy.int64)
+            return
+        store = self.objects[liveSlots[0]].store
+        self.useKernels = store.useKernels
+        storeIdxs = numpy.array([self.objects[slot].storeIdx for slot in liveSlots], dtype=numpy.int64)
+        pos = store.pos[storeIdxs]
+        colStart, colCount, rowStart, rowCount = self.getBucketRanges(pos[:, 0], pos[:, 1], store.radius[storeIdxs])
+        self.slotLeft[liveSlots] = colStart
+        self.slotTop[liveSlots] = rowStart
+        if self.useKernels:
+            self.entries, self.entryBuckets = kernels.sortEntriesByBucket(liveSlots, colStart, colCount, rowStart,
+                                                                          rowCount, self.cols, self.bucketStarts)
+            return
+        # Expand every object into one entry per covered bucket
+        counts = colCount * rowCount
+        total = counts.sum()
+        entrySlots = numpy.repeat(liveSlots, counts)
+        offsets = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        entryColCount = numpy.repeat(colCount, counts)
+        entryCols = numpy.repeat(colStart, counts) + offsets % entryColCount
+        entryRows = numpy.repeat(rowStart, counts) + offsets // entryColCount
+        entryBuckets = entryCols + entryRows * self.cols
+        order = numpy.argsort(entryBuckets, kind="stable")
+        self.entries = entrySlots[order]
+        self.entryBuckets = entryBuckets[order]
+        self.bucketStarts[0] = 0
+        numpy.cumsum(numpy.bincount(entryBuckets, minlength=self.numBuckets), out=self.bucketStarts[1:])
+
+    # Vectorized version of SpatialHashTable.getAreaKey, returns the first bucket column and row and the number of
+    # bucket columns and rows covered by each circle
+    def getBucketRanges(self, x, y, radius):
+        bucketSize = self.bucketSize
+        bucketLeft, limitX, bucketTop, limitY = getAreaKeys(x, y, radius, self.size, bucketSize)
+        colCount = numpy.maximum(0, -((bucketLeft - limitX) // bucketSize))
+        rowCount = numpy.maximum(0, -((bucketTop - limitY) // bucketSize))
+        return bucketLeft // bucketSize, colCount, bucketTop // bucketSize, rowCount
+
+    # Returns the slots of all live objects in the buckets covered by the circle, every slot once
+    def getNearbySlotsInArea(self, pos, radius):
+        if not self.slots:
+            return self.entries[:0]
+        if self.dirty:
+            self.rebuild()
+        bucketSize = self.bucketSize
+        cellLeft = max(0, pos[0] - radius)
+        cellTop = max(0, pos[1] - radius)
+        bucketLeft = int(cellLeft - cellLeft % bucketSize)
+        bucketTop = int(cellTop - cellTop % bucketSize)
+        colStart = bucketLeft // bucketSize
+        rowStart = bucketTop // bucketSize
+        colEnd = colStart - ((bucketLeft - int(min(self.size, pos[0] + radius + 1))) // bucketSize)
+        rowEnd = rowStart - ((bucketTop - int(min(self.size, pos[1] + radius + 1))) // bucketSize)
+        if colEnd <= colStart or rowEnd <= rowStart:
+            return self.entries[:0]
+        bucketStarts = self.bucketStarts
+        if self.useKernels:
+            return kernels.gatherSlots(self.entries, self.entryBuckets, bucketStarts, self.slotLeft, self.slotTop,
+                                       self.alive, colStart, colEnd, rowStart, rowEnd, self.cols)
+        if rowEnd - rowStart == 1 and colEnd - colStart == 1:
+            # Every object is in a bucket at most once
+            bucket = rowStart * self.cols + colStart
+            slots = self.entries[bucketStarts[bucket]:bucketStarts[bucket + 1]]
+            return slots[self.alive[slots]] if self.numDead else slots
+        if rowEnd - rowStart == 1:
+            bucket = rowStart * self.cols
+            first = bucketStarts[bucket + colStart]
+            last = bucketStarts[bucket + colEnd]
+            slots = self.entries[first:last]
+            buckets = self.entryBuckets[first:last]
+        else:
+            rowBuckets = numpy.arange(rowStart, rowEnd) * self.cols
+            firsts = bucketStarts[rowBuckets + colStart]
+            lasts = bucketStarts[rowBuckets + colEnd]
+            slots = numpy.concatenate([self.entries[first:last] for first, last in zip(firsts, lasts)])
+            buckets = numpy.concatenate([self.entryBuckets[first:last] for first, last in zip(firsts, lasts)])
+        # An object that covers several of the queried buckets is only reported in the first of them
+        firstCol = numpy.maximum(self.slotLeft[slots], colStart)
+        firstRow = numpy.maximum(self.slotTop[slots], rowStart)
+        keep = (buckets == firstCol + firstRow * self.cols) & self.alive[slots]
+        return slots[keep]
+
+    def getObjectsForSlots(self, slots):
+        objects = self.objects
+        return [objects[slot] for slot in slots.tolist()]
+
+    # Returns the rows of the nearby objects in their cell store
+    def getNearbyIdxsInArea(self, pos, radius):
+        objects = self.objects
+        return numpy.array([objects[slot].storeIdx for slot in self.getNearbySlotsInArea(pos, radius).tolist()],
+                           dtype=numpy.int64)
+
+    def getNearbyObjects(self, obj):
+        return self.getObjectsForSlots(self.getNearbySlotsInArea(obj.getPos(), obj.getRadius()))
+
+    def getNearbyObjectsInArea(self, pos, rad):
+        return self.getObjectsForSlots(self.getNearbySlotsInArea(pos, rad))
+
+    def getNearbyEnemyObjects(self, obj):
+        player = obj.getPlayer()
+        return [nearbyObject for nearbyObject in self.getNearbyObjects(obj) if nearbyObject.getPlayer() is not player]
+
+    def getCols(self):
+        return self.cols
+
+    def getRows(self):
+        return self.rows
+
+    def getBucketContent(self, idx):
+        if self.dirty:
+            self.rebuild()
+        slots = self.entries[self.bucketStarts[idx]:self.bucketStarts[idx + 1]]
+        return self.getObjectsForSlots(slots[self.alive[slots]])
+
+    def isBucketEmpty(self, idx):
+        if self.dirty:
+            self.rebuild()
+        return not self.alive[self.entries[self.bucketStarts[idx]:self.bucketStarts[idx + 1]]].any()
+
+    # Number of live objects in every bucket, ordered by bucket id
+    def getBucketSizes(self):
+        if self.dirty:
+            self.rebuild()
+        return numpy.bincount(self.entryBuckets[self.alive[self.entries]], minlength=self.numBuckets)
+
+    def getCenterOfBucket(self, id):
+        x = id % self.cols * self.bucketSize + self.bucketSize / 2
+        y = int(id /self.cols) * self.bucketSize + self.bucketSize / 2
+        return (x,y)
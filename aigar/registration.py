@@ -0,0 +1,73 @@
+# The env ids are derived from the options below. Building the table does not import gym or any env module, gym
+# only imports aigar.envs (and through it pygame, for rgb envs with the pygame backend) once an env is made.
+
+# Define all possible options:
+greedy_opts = [0, 1, 2, 5]
+# Crowded arenas with hundreds of greedy bots, the field grows with the number of players
+arena_opts = [50, 100, 200, 500]
+rgb_opts = [True, False]
+split_opts = [False, True]
+eject_opts = [False, True]
+# Downscaled resolutions of the rgb observations (None keeps the default resolution):
+resolution_opts = [None, 84, 64]
+# Field updates per step, the action is repeated and only the last update is observed:
+frame_skip_opts = [1, 2, 4]
+
+ENTRY_POINT = 'aigar.envs:AigarEnv'
+
+
+# Returns the kwargs of AigarEnv for every env id
+def getEnvSpecs():
+    specs = {}
+    name = 'Aigar'
+    for greedy in greedy_opts + arena_opts:
+        for rgb in rgb_opts:
+            for split in split_opts:
+                for eject in eject_opts:
+                    for resolution in resolution_opts:
+                        for frame_skip in frame_skip_opts:
+                            if eject and not split:
+                                continue
+                            if resolution and not rgb:
+                                continue
+
+                            if greedy in arena_opts:
+                                new_name = name + "Arena" + str(greedy)
+                            elif greedy:
+                                new_name = name + "Greedy" + str(greedy)
+                            else:
+                                new_name = name + "Pellet"
+                            if not rgb:
+                                new_name += "Grid"
+                            if resolution:
+                                new_name += "Res" + str(resolution)
+                            if split:
+                                new_name += "Split"
+                            if eject:
+                                new_name += "Eject"
+                            if frame_skip > 1:
+                                new_name += "Skip" + str(frame_skip)
+                            new_name += "-v0"
+                            kwargs = {"rgb": rgb,
+                                      "num_greedy": greedy,
+                                      "split": split,
+                                      "eject": eject}
+                            if resolution:
+                                kwargs["rgb_resolution"] = resolution
+                            if frame_skip > 1:
+                                kwargs["frame_skip"] = frame_skip
+                            specs[new_name] = kwargs
+    return specs
+
+
+# Registers all env ids with gym. Ids that are already registered are skipped, such that it can be called repeatedly.
+def register_envs():
+    from gym.envs.registration import register, registry
+    for envId, kwargs in getEnvSpecs().items():
+        if envId in registry:
+            continue
+        register(
+            id = envId,
+            entry_point = ENTRY_POINT,
+            kwargs = kwargs
+        )
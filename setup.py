@@ -18,6 +18,7 @@ setup(
     url = "https://github.com/NotNANtoN/aigar",
     packages = setuptools.find_packages(exclude=['tests', 'tests.*']),
     install_requires = requirements,
+    extras_require = {"numba": ["numba"]},
     long_description = long_description,
     long_description_content_type="text/markdown",
     classifiers = [
@@ -0,0 +1,48 @@
+from aigar.envs.model.cell import Cell
+from aigar.envs.model.field import Field
+from aigar.envs.model.player import Player
+
+
+# A field without viruses whose players only have the given cells, as lists of (x, y, mass) per player. The players
+# aim at their first cell, such that the cells barely move.
+def createField(cellsOfPlayers):
+    field = Field(False, seed=0)
+    players = [Player("Player " + str(playerNr)) for playerNr in range(len(cellsOfPlayers))]
+    for player in players:
+        field.addPlayer(player)
+    field.initialize(fieldScale=3)
+    for player, cellStates in zip(players, cellsOfPlayers):
+        spawnedCells = list(player.getCells())
+        for x, y, mass in cellStates:
+            field.addPlayerCell(Cell(x, y, mass, player, field.getCellStore()))
+        for cell in spawnedCells:
+            field.deletePlayerCell(cell)
+        player.setCommands(cellStates[0][0], cellStates[0][1], False, False)
+    return field, players
+
+
+def test_overlapping_cells_of_a_player_merge():
+    field, (player,) = createField([[(150, 150, 420), (150, 151, 400)]])
+    field.update()
+    assert len(player.getCells()) == 1
+    assert player.getCells()[0].getMass() > 800
+
+
+def test_overlapping_enemy_cell_is_eaten_in_the_same_tick():
+    field, (eater, eaten) = createField([[(150, 150, 420)], [(155, 150, 20)]])
+    field.update()
+    assert not eaten.getIsAlive()
+    assert eater.getCells()[0].getMass() > 420
+
+
+# The pairs of player cells are found once per tick, before the merges. An enemy cell that only comes within reach
+# because its eater grew by a merge is eaten in the next tick.
+def test_contact_created_by_a_merge_is_resolved_in_the_next_tick():
+    field, (eater, eaten) = createField([[(150, 150, 420), (150, 151, 400)], [(164.8, 150, 20)]])
+    field.update()
+    assert len(eater.getCells()) == 1
+    assert eaten.getIsAlive()
+    assert eater.getCells()[0].overlap(eaten.getCells()[0])
+    field.update()
+    assert not eaten.getIsAlive()
+    assert len(eater.getCells()) == 1
@@ -0,0 +1,40 @@
+import numpy
+import pytest
+
+pytest.importorskip("numba")
+
+from aigar.envs.aigarEnv import AigarEnv
+from aigar.envs.model.kernels import KERNEL_TOLERANCES, checkKernels, getUlpDifference
+
+
+def test_kernels_match_numpy():
+    checkKernels()
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_kernel_trajectory_matches_numpy(seed):
+    steps = 25
+    envs = [AigarEnv(num_greedy=5, split=True, eject=True, seed=seed, kernel_backend=backend)
+            for backend in ("numpy", "numba")]
+    for env in envs:
+        env.reset()
+        # Big enough to split, such that the cells of a player are pushed apart
+        for cell in env.getField().getPlayerCells():
+            cell.setMass(400)
+    rng = numpy.random.default_rng(seed)
+    for step in range(steps):
+        action = rng.random(envs[0].num_actions)
+        dones = [env.step(action)[2] for env in envs]
+        assert dones[0] == dones[1]
+        stores = [env.getField().getCellStore() for env in envs]
+        count = stores[0].getCount()
+        assert stores[1].getCount() == count
+        for name in ("kind", "owner", "splitVelocityCounter"):
+            assert numpy.array_equal(getattr(stores[0], name)[:count], getattr(stores[1], name)[:count]), name
+        # Only the kinematics may differ, by the tolerance of updateCellProperties for every field update so far
+        tolerance = KERNEL_TOLERANCES["updateCellProperties"] * (step + 1)
+        for name in ("pos", "mass", "radius", "velocity", "splitVelocity", "mergeTime"):
+            difference = getUlpDifference(getattr(stores[0], name)[:count], getattr(stores[1], name)[:count])
+            assert difference <= tolerance, name
+        if dones[0]:
+            break